@@ -0,0 +1,181 @@
+"""Admission control for the Flask API.
+
+Each route gets a concurrency limit, a short bounded wait queue and a
+Mongo deadline. A request that finds the queue full, or that waits too
+long for a slot, is answered at once with 503 and Retry-After instead of
+holding a worker thread while Mongo is slow.
+
+Routes also have a priority. All routes together may run at most
+ADMISSION_CAPACITY requests per process. Lower-priority routes stop
+being admitted before that point, so health checks and status lookups
+still get through while batch work and runs are being shed.
+
+The deadline is applied with pymongo.timeout, so every Mongo operation
+in the request shares it: server selection, pool checkout and the
+server-side maxTimeMS are all capped by what is left. Time spent waiting
+for admission counts against it.
+"""
+from functools import wraps
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+import metrics
+import responses
+
+HIGH = 'high'
+NORMAL = 'normal'
+LOW = 'low'
+
+# Share of ADMISSION_CAPACITY each priority may fill
+PRIORITY_SHARE = {HIGH: 1.0, NORMAL: 0.75, LOW: 0.5}
+
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', '1') != '0'
+# Concurrent requests per process; defaults to gunicorn.conf.py's thread count
+ADMISSION_CAPACITY = int(os.getenv(
+    'ADMISSION_CAPACITY',
+    os.getenv('GUNICORN_THREADS', str(max(2, min(8, (os.cpu_count() or 1) * 2))))
+))
+
+
+class Rejected(Exception):
+    def __init__(self, route: str, reason: str, retry_after: int):
+        super().__init__(f"{route}: {reason}")
+        self.route = route
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Gate:
+    def __init__(self, controller: 'AdmissionController', route: str, priority: str, limit: int,
+                 queue: int, wait: float, deadline: Optional[float], retry_after: int):
+        self.controller = controller
+        self.route = route
+        self.priority = priority
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.deadline = deadline
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.waiting = 0
+        self.ceiling = max(1, int(controller.capacity * PRIORITY_SHARE[priority]))
+
+    def _full(self) -> bool:
+        return self.in_flight >= self.limit or self.controller.in_flight >= self.ceiling
+
+
+class AdmissionController:
+    def __init__(self, capacity: int = ADMISSION_CAPACITY):
+        self.capacity = capacity
+        self.in_flight = 0
+        self.gates: Dict[str, Gate] = {}
+        self._released = threading.Condition(threading.Lock())
+
+    def gate(self, route: str, priority: str = NORMAL, limit: Optional[int] = None, queue: int = 0,
+             wait: float = 0.0, deadline: Optional[float] = None, retry_after: int = 1) -> Gate:
+        gate = Gate(self, route, priority, limit or self.capacity, queue, wait, deadline, retry_after)
+        self.gates[route] = gate
+        return gate
+
+    def acquire(self, gate: Gate) -> None:
+        """Take a slot for gate or raise Rejected."""
+        with self._released:
+            if gate._full():
+                if gate.waiting >= gate.queue:
+                    raise Rejected(gate.route, 'queue_full', gate.retry_after)
+                gate.waiting += 1
+                try:
+                    give_up = time.monotonic() + gate.wait
+                    while gate._full():
+                        remaining = give_up - time.monotonic()
+                        if remaining <= 0:
+                            raise Rejected(gate.route, 'wait_timeout', gate.retry_after)
+                        self._released.wait(remaining)
+                finally:
+                    gate.waiting -= 1
+            gate.in_flight += 1
+            self.in_flight += 1
+
+    def release(self, gate: Gate) -> None:
+        with self._released:
+            gate.in_flight -= 1
+            self.in_flight -= 1
+            # Waiters differ in route and priority, so any of them may fit
+            self._released.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._released:
+            return {
+                route: {"in_flight": gate.in_flight, "waiting": gate.waiting}
+                for route, gate in self.gates.items()
+            }
+
+
+controller = AdmissionController()
+
+
+def deadline_exceeded(error: Optional[BaseException]) -> bool:
+    """True if error, or one it was raised while handling, is a Mongo timeout."""
+    from pymongo.errors import PyMongoError
+
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, PyMongoError) and error.timeout:
+            return True
+        seen.add(id(error))
+        # utils re-raises Mongo errors as plain exceptions inside except
+        # blocks, so the original is in the context
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def overloaded_response(retry_after: int = 1, reason: str = 'overloaded'):
+    return responses.json_response(
+        {"error": "Service is busy, try again shortly", "reason": reason}, 503,
+        headers={'Retry-After': str(retry_after)}
+    )
+
+
+def admit(priority: str = NORMAL, limit: Optional[int] = None, queue: int = 0, wait: float = 0.0,
+          deadline: Optional[float] = None, retry_after: int = 1) -> Callable:
+    """Decorate a view with a concurrency limit, wait queue and Mongo deadline in seconds."""
+    def decorator(f: Callable) -> Callable:
+        gate = controller.gate(f.__name__, priority, limit, queue, wait, deadline, retry_after)
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not ADMISSION_ENABLED:
+                return f(*args, **kwargs)
+            import pymongo
+            from flask import request
+
+            started = time.monotonic()
+            try:
+                controller.acquire(gate)
+            except Rejected as e:
+                route = request.url_rule.rule if request.url_rule else 'unmatched'
+                metrics.registry.inc('admission_rejections_total', (('route', route), ('reason', e.reason)))
+                return overloaded_response(e.retry_after, e.reason)
+            try:
+                if gate.deadline is None:
+                    return f(*args, **kwargs)
+                remaining = gate.deadline - (time.monotonic() - started)
+                with pymongo.timeout(max(remaining, 0.001)):
+                    return f(*args, **kwargs)
+            finally:
+                controller.release(gate)
+        return decorated_function
+    return decorator
+
+
+metrics.registry.describe('admission_rejections_total', 'counter', 'Requests shed by admission control')
+metrics.registry.describe('admission_deadline_exceeded_total', 'counter', 'Requests that ran out of their Mongo deadline')
+metrics.registry.gauge(
+    'admission_in_flight', 'Admitted requests running by view',
+    lambda: {(('endpoint', route),): value['in_flight'] for route, value in controller.stats().items()}
+)
+metrics.registry.gauge(
+    'admission_waiting', 'Requests waiting for admission by view',
+    lambda: {(('endpoint', route),): value['waiting'] for route, value in controller.stats().items()}
+)
@@ -0,0 +1,165 @@
+"""Signup analytics kept as counters updated at write time.
+
+Every user write applies the difference between the stored document
+before and after it as $inc operations on the analytics collection, so
+reading the counters never touches the users. They track what an
+aggregation over the users collection would return, but are not
+guaranteed to equal it: utils.save_users reads the "before" documents
+in a query of its own ahead of the bulk write, so concurrent writes to
+the same email can shift a counter, and a failed counter update is
+lost. Counters are keyed by (metric, country, key):
+
+    keyword, <country> or "*", <keyword phrase>  -> users with that keyword
+    signup,  <country> or "*", <YYYY-MM-DD>      -> users who signed up that day
+
+A failed counter update is logged and never fails the write that caused
+it. Run `python migrations.py rebuild-analytics` to reconcile: it
+recomputes every counter from the users collection.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import database
+import payments
+
+logger = logging.getLogger(__name__)
+
+KEYWORD = 'keyword'
+SIGNUP = 'signup'
+
+# Country of the counters kept across all countries
+ALL_COUNTRIES = '*'
+UNKNOWN_COUNTRY = 'unknown'
+
+# Keyword phrases longer than this are cut, bounding counter keys
+MAX_KEYWORD_LENGTH = 100
+
+# User fields the counters are derived from
+FIELDS = ('job_keywords', 'country', 'signup_date')
+
+CounterKey = Tuple[str, str, str]
+
+
+def keyword_phrases(value: Any) -> set:
+    """Normalized keyword phrases from a list or a comma-separated string."""
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)):
+        return set()
+    return {
+        item.strip().casefold()[:MAX_KEYWORD_LENGTH]
+        for item in value
+        if isinstance(item, str) and item.strip()
+    }
+
+
+def signup_day(value: Any) -> Optional[str]:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, str) and len(value) >= 10:
+        return value[:10]
+    return None
+
+
+def counters(user: Optional[Dict[str, Any]]) -> Counter:
+    """The counters one stored user contributes to."""
+    counts: Counter = Counter()
+    if not user:
+        return counts
+    country = payments.normalize_country(user.get('country')) or UNKNOWN_COUNTRY
+    for phrase in keyword_phrases(user.get('job_keywords')):
+        counts[(KEYWORD, country, phrase)] += 1
+        counts[(KEYWORD, ALL_COUNTRIES, phrase)] += 1
+    day = signup_day(user.get('signup_date'))
+    if day:
+        counts[(SIGNUP, country, day)] += 1
+        counts[(SIGNUP, ALL_COUNTRIES, day)] += 1
+    return counts
+
+
+def deltas(changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> Dict[CounterKey, int]:
+    """Sum the counter changes of (before, after) document pairs."""
+    total: Counter = Counter()
+    for before, after in changes:
+        total.update(counters(after))
+        total.subtract(counters(before))
+    return {key: amount for key, amount in total.items() if amount}
+
+
+def _increments(amounts: Dict[CounterKey, int]) -> list:
+    from pymongo import UpdateOne
+
+    return [
+        UpdateOne({'metric': metric, 'country': country, 'key': key}, {'$inc': {'count': amount}}, upsert=True)
+        for (metric, country, key), amount in amounts.items()
+    ]
+
+
+def record(changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]) -> None:
+    """Apply the counter changes of (before, after) pairs in one bulk write."""
+    from pymongo.errors import BulkWriteError
+
+    amounts = deltas(changes)
+    if not amounts:
+        return
+    requests = _increments(amounts)
+    collection = database.get_analytics_collection()
+    try:
+        try:
+            collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # Two writers upserting the same new counter: the loser's
+            # retry finds the document and increments it
+            errors = e.details.get('writeErrors', [])
+            duplicates = [error['index'] for error in errors if error.get('code') == 11000]
+            if duplicates:
+                collection.bulk_write([requests[index] for index in duplicates], ordered=False)
+            if len(duplicates) != len(errors):
+                raise
+    except Exception as e:
+        logger.warning("Analytics update failed: %s", e)
+
+
+def top_keywords(country: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+    country = payments.normalize_country(country) or ALL_COUNTRIES
+    cursor = database.get_analytics_collection().find(
+        {'metric': KEYWORD, 'country': country, 'count': {'$gt': 0}},
+        {'_id': 0, 'key': 1, 'count': 1}
+    ).sort('count', -1).limit(limit)
+    return [{"keyword": doc['key'], "count": doc['count']} for doc in cursor]
+
+
+def signups_per_day(days: int = 30, country: Optional[str] = None) -> List[Dict[str, Any]]:
+    country = payments.normalize_country(country) or ALL_COUNTRIES
+    since = (datetime.utcnow().date() - timedelta(days=days - 1)).isoformat()
+    cursor = database.get_analytics_collection().find(
+        {'metric': SIGNUP, 'country': country, 'key': {'$gte': since}, 'count': {'$gt': 0}},
+        {'_id': 0, 'key': 1, 'count': 1}
+    ).sort('key', 1)
+    return [{"date": doc['key'], "count": doc['count']} for doc in cursor]
+
+
+def rebuild(batch_size: int = 1000) -> int:
+    """Recompute every counter with one pass over the users collection.
+
+    Signups written while this runs may be counted twice or not at all,
+    so run it while writes are paused. Returns the number of counters.
+    """
+    from pymongo import InsertOne
+
+    totals: Counter = Counter()
+    projection = dict.fromkeys(FIELDS, 1)
+    projection['_id'] = 0
+    for user in database.get_users_collection().find({}, projection, batch_size=batch_size):
+        totals.update(counters(user))
+
+    collection = database.get_analytics_collection()
+    collection.delete_many({})
+    requests = [
+        InsertOne({'metric': metric, 'country': country, 'key': key, 'count': count})
+        for (metric, country, key), count in totals.items()
+    ]
+    for start in range(0, len(requests), batch_size):
+        collection.bulk_write(requests[start:start + batch_size], ordered=False)
+    return len(requests)
@@ -1,35 +1,22 @@
 from http.server import BaseHTTPRequestHandler
-import json
-import os
-from pymongo import MongoClient
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# MongoDB setup
-MONGODB_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGODB_URI)
+from urllib.parse import parse_qs, urlparse
+import health
+import responses
 
 class handler(BaseHTTPRequestHandler):
     def do_GET(self):
         try:
-            # Test MongoDB connection
-            client.admin.command('ismaster')
-            
-            self._send_response(200, {
-                "status": "healthy",
-                "database": "connected"
-            })
+            # Listens to the driver's heartbeats from the first request on;
+            # the client is only built after this
+            health.install()
+            query = parse_qs(urlparse(self.path).query)
+            report = health.status(deep=query.get('deep', [None])[0] in ('1', 'true'))
+            self._send_response(health.http_status(report), report)
         except Exception as e:
-            self._send_response(500, {
+            self._send_response(503, {
                 "status": "unhealthy",
                 "error": str(e)
             })
 
     def _send_response(self, status_code, data):
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
-        self.wfile.write(json.dumps(data).encode('utf-8'))
\ No newline at end of file
+        responses.send_json(self, status_code, data, 'GET')
@@ -0,0 +1,107 @@
+"""Import-time profile and cold-start budget for the entry points.
+
+Each module is imported in a fresh interpreter under `python -X importtime`
+and the self time of every imported module is summed, overall and per
+top-level package:
+
+    python benchmarks/importtime.py api.status main
+    python benchmarks/importtime.py api.health api.signup api.status --budget-ms 150 --forbid pymongo dns
+
+The interpreter gets a mongodb+srv:// URI for a host that does not exist,
+so a module that builds the client or resolves SRV records at import
+shows up as a failure or a blown budget. --budget-ms and --forbid make
+the run exit with status 1; tests/test_cold_start.py enforces the same
+budgets under pytest.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Never resolvable: a module that resolves it at import fails loudly
+COLD_START_URI = 'mongodb+srv://cold-start.invalid/jobhunter'
+
+Timing = Tuple[str, int, int]
+
+
+def profile(module: str) -> Tuple[List[Timing], List[str]]:
+    """Import module in a fresh interpreter.
+
+    Returns (name, self_us, cumulative_us) per imported module, in import
+    order, and the names of every module loaded by the end.
+    """
+    env = dict(os.environ, PYTHONPATH=ROOT, MONGODB_URI=COLD_START_URI)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    # A first run writes the bytecode caches so compiling is not measured
+    subprocess.run([sys.executable, '-c', f'import {module}'], cwd=ROOT, env=env, capture_output=True)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings, result.stdout.split()
+
+
+def by_package(timings: List[Timing]) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for name, self_us, _ in timings:
+        package = name.split('.', 1)[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return totals
+
+
+def print_profile(module: str, timings: List[Timing], top: int) -> None:
+    total = sum(self_us for _, self_us, _ in timings)
+    print(f"\n{module}: {total / 1000:.1f} ms over {len(timings)} modules")
+    print(f"  {'package':<28} {'self ms':>9} {'share':>7}")
+    for package, self_us in sorted(by_package(timings).items(), key=lambda item: -item[1])[:top]:
+        print(f"  {package:<28} {self_us / 1000:>9.1f} {self_us / total:>7.0%}")
+    print(f"  {'module':<40} {'self ms':>9} {'cumul ms':>9}")
+    for name, self_us, cumulative_us in sorted(timings, key=lambda item: -item[1])[:top]:
+        print(f"  {name:<40} {self_us / 1000:>9.1f} {cumulative_us / 1000:>9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile import time of the JobHunter entry points")
+    parser.add_argument('modules', nargs='+', help="Modules to import, e.g. api.status or main")
+    parser.add_argument('--top', type=int, default=15, help="Rows per table")
+    parser.add_argument('--repeat', type=int, default=3, help="Imports per module; the fastest is kept")
+    parser.add_argument('--budget-ms', type=float, help="Fail when a module takes longer to import")
+    parser.add_argument('--forbid', nargs='*', default=[],
+                        help="Top-level packages that must not be imported, e.g. pymongo")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        try:
+            runs = [profile(module) for _ in range(max(1, args.repeat))]
+        except RuntimeError as e:
+            failures.append(str(e))
+            continue
+        timings, loaded = min(runs, key=lambda run: sum(self_us for _, self_us, _ in run[0]))
+        print_profile(module, timings, args.top)
+
+        total_ms = sum(self_us for _, self_us, _ in timings) / 1000
+        if args.budget_ms is not None and total_ms > args.budget_ms:
+            failures.append(f"{module}: {total_ms:.1f} ms exceeds the {args.budget_ms:g} ms budget")
+        for package in args.forbid:
+            if package in loaded:
+                failures.append(f"{module}: imports {package} at import time")
+
+    if failures:
+        print("\nFailures:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
@@ -0,0 +1,285 @@
+"""Load and latency benchmarks for the Flask app and the api/*.py handlers.
+
+Requests run in-process against mongomock by default, or against a real
+mongod with --mongodb-uri. Each scenario sends a weighted mix of signup,
+status, run and upgrade traffic and reports req/s and p50/p95/p99 per
+endpoint.
+
+    python benchmarks/run.py --save benchmarks/baseline.json
+    python benchmarks/run.py --compare benchmarks/baseline.json
+
+--compare exits with status 1 when any endpoint's p99 or throughput
+regresses by more than --tolerance against the baseline. Timings depend
+on the machine, so only compare against a baseline saved on the same
+one; CI runs the benchmark as a report.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+import utils  # noqa: E402
+
+COUNTRIES = ['Uganda', 'Kenya', 'Nigeria', 'Ghana', 'United States', 'Germany', 'India']
+KEYWORDS = ['python developer', 'data scientist', 'remote work', 'devops engineer', 'react', 'product manager']
+
+# Share of requests per endpoint
+FLASK_MIX = {'signup': 5, 'status': 60, 'run': 20, 'upgrade': 15}
+HANDLER_MIX = {'signup': 10, 'status': 85, 'health': 5}
+# mongomock has no admin commands, so health only runs against mongod
+MONGOMOCK_HANDLER_MIX = {'signup': 10, 'status': 90}
+
+
+def connect(mongodb_uri: str = None) -> Callable[[], None]:
+    """Point the data layer at mongomock or a local mongod; returns cleanup."""
+    database.DATABASE_NAME = 'jobhunter_bench'
+    if mongodb_uri:
+        database.MONGODB_URI = mongodb_uri
+        database.reset_client()
+    else:
+        try:
+            import mongomock
+        except ImportError:
+            sys.exit("mongomock is not installed; pip install -r benchmarks/requirements.txt or pass --mongodb-uri")
+        database.use_client(mongomock.MongoClient())
+
+    database.get_client().drop_database(database.DATABASE_NAME)
+    database.ensure_indexes()
+    return lambda: database.get_client().drop_database(database.DATABASE_NAME)
+
+
+def seed_users(count: int) -> List[str]:
+    emails = [f"bench{i}@example.com" for i in range(count)]
+    users = [
+        utils.build_user({
+            'email': email,
+            'job_keywords': random.sample(KEYWORDS, 2),
+            'country': random.choice(COUNTRIES)
+        })
+        for email in emails
+    ]
+    utils.save_users(users)
+    utils.user_cache.clear()
+    return emails
+
+
+def signup_body(seq: int) -> bytes:
+    return json.dumps({
+        'email': f"new{seq}-{random.getrandbits(32)}@example.com",
+        'job_keywords': random.sample(KEYWORDS, 2),
+        'country': random.choice(COUNTRIES)
+    }).encode('utf-8')
+
+
+def pick_email(emails: List[str]) -> str:
+    # A few lookups miss, as real polling traffic does
+    if random.random() < 0.02:
+        return f"missing{random.getrandbits(32)}@example.com"
+    return random.choice(emails)
+
+
+# Flask app
+
+def flask_requester(emails: List[str]) -> Callable[[str, int], int]:
+    import admission
+    import main
+    main.limiter.enabled = False
+    # The load generator is not an overload; shed requests would only be
+    # measured as fast 503s
+    admission.ADMISSION_ENABLED = False
+    local = threading.local()
+
+    def send(endpoint: str, seq: int) -> int:
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = main.app.test_client()
+        if endpoint == 'signup':
+            response = client.post('/api/signup', data=signup_body(seq), content_type='application/json')
+        else:
+            response = client.get(f'/api/{endpoint}', query_string={'email': pick_email(emails)})
+        return response.status_code
+
+    return send
+
+
+# BaseHTTPRequestHandler functions
+
+class FakeSocket:
+    """Just enough of a socket for StreamRequestHandler."""
+
+    def __init__(self, raw: bytes):
+        self._raw = raw
+        self.sent = bytearray()
+
+    def makefile(self, mode: str, bufsize: int = -1):
+        return io.BytesIO(self._raw)
+
+    def sendall(self, data: bytes) -> None:
+        self.sent += data
+
+
+def handler_requester(emails: List[str]) -> Callable[[str, int], int]:
+    handlers = {}
+    for name in ('signup', 'status', 'health'):
+        module = importlib.import_module(f'api.{name}')
+        handlers[name] = type('QuietHandler', (module.handler,), {'log_message': lambda *args: None})
+
+    def send(endpoint: str, seq: int) -> int:
+        if endpoint == 'signup':
+            body = signup_body(seq)
+            raw = (
+                b"POST /api/signup HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        elif endpoint == 'status':
+            raw = f"GET /api/status?email={pick_email(emails)} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+        else:
+            raw = f"GET /api/{endpoint} HTTP/1.1\r\nHost: bench\r\n\r\n".encode()
+        sock = FakeSocket(raw)
+        handlers[endpoint](sock, ('127.0.0.1', 0), None)
+        return int(bytes(sock.sent).split(b' ', 2)[1])
+
+    return send
+
+
+# Driver
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_scenario(send: Callable[[str, int], int], mix: Dict[str, int], requests: int,
+                 concurrency: int, warmup: int) -> Dict[str, Dict[str, float]]:
+    endpoints = random.choices(list(mix), weights=list(mix.values()), k=requests + warmup)
+    for seq, endpoint in enumerate(endpoints[:warmup]):
+        send(endpoint, seq)
+
+    def timed(item: Tuple[int, str]) -> Tuple[str, float, int]:
+        seq, endpoint = item
+        started = time.perf_counter()
+        status = send(endpoint, seq)
+        return endpoint, time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(timed, enumerate(endpoints[warmup:], start=warmup)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    by_endpoint: Dict[str, List[Tuple[float, int]]] = {}
+    for endpoint, latency, status in samples:
+        by_endpoint.setdefault(endpoint, []).append((latency, status))
+    for endpoint, items in sorted(by_endpoint.items()):
+        latencies = sorted(latency for latency, _ in items)
+        results[endpoint] = {
+            'requests': len(items),
+            'errors': sum(1 for _, status in items if status >= 500),
+            'rps': len(items) / elapsed,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000
+        }
+    results['total'] = {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status in samples if status >= 500),
+        'rps': len(samples) / elapsed
+    }
+    return results
+
+
+def print_report(report: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    for scenario, results in report.items():
+        total = results['total']
+        print(f"\n{scenario}: {total['requests']} requests, {total['rps']:.0f} req/s, {total['errors']} errors")
+        print(f"  {'endpoint':<10} {'count':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for endpoint, row in results.items():
+            if endpoint == 'total':
+                continue
+            print(
+                f"  {endpoint:<10} {row['requests']:>7} {row['rps']:>9.0f} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}"
+            )
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for scenario, results in report.items():
+        for endpoint, row in results.items():
+            base = baseline.get(scenario, {}).get(endpoint)
+            if not base or endpoint == 'total':
+                continue
+            if row['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{scenario}/{endpoint}: p99 {row['p99_ms']:.2f} ms vs baseline {base['p99_ms']:.2f} ms")
+            if row['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{scenario}/{endpoint}: {row['rps']:.0f} req/s vs baseline {base['rps']:.0f} req/s")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the JobHunter endpoints")
+    parser.add_argument('--mongodb-uri', help="Use a real mongod instead of mongomock")
+    parser.add_argument('--scenario', choices=['flask', 'handlers', 'all'], default='all')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', help="Write results to this baseline file")
+    parser.add_argument('--compare', help="Fail on regressions against this baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    cleanup = connect(args.mongodb_uri)
+    try:
+        emails = seed_users(args.users)
+        report = {}
+        if args.scenario in ('flask', 'all'):
+            report['flask'] = run_scenario(flask_requester(emails), FLASK_MIX, args.requests, args.concurrency, args.warmup)
+        if args.scenario in ('handlers', 'all'):
+            mix = HANDLER_MIX if args.mongodb_uri else MONGOMOCK_HANDLER_MIX
+            report['handlers'] = run_scenario(handler_requester(emails), mix, args.requests, args.concurrency, args.warmup)
+    finally:
+        cleanup()
+
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(report, _meta={
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'backend': 'mongod' if args.mongodb_uri else 'mongomock',
+                'requests': args.requests,
+                'concurrency': args.concurrency
+            }), f, indent=2)
+        print(f"\nSaved baseline to {args.save}")
+
+    if args.compare:
+        if not os.path.exists(args.compare):
+            # A missing baseline must not pass as "no regressions"
+            print(f"\nNo baseline at {args.compare}; create one with --save")
+            sys.exit(1)
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+# Returned by TTLCache.get when nothing usable is cached
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a fixed time to live.
+
+    Entries may carry their own TTL, which is how short-lived negative
+    entries sit next to regular ones. All operations are thread-safe.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'forgotten')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.forgotten = False
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers arriving while
+    it runs wait and share its result or exception. Nothing is kept once
+    the call returns, so results are never older than the call itself.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any], also: Iterable[Hashable] = ()) -> Tuple[Any, Hashable, bool]:
+        """Return (result, flight key, owner).
+
+        A call in flight under any key in also is joined too, e.g. one
+        whose result is a superset of what this caller needs; the flight
+        key says which one was joined. owner is True only for the caller
+        that ran func, and only if the key was not forgotten meanwhile.
+        """
+        with self._lock:
+            for joined in (key, *also):
+                flight = self._flights.get(joined)
+                if flight is not None:
+                    self.collapsed += 1
+                    break
+            else:
+                joined = None
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+
+        if joined is not None:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, joined, False
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+        return flight.result, key, not flight.forgotten
+
+    def forget(self, key: Hashable) -> None:
+        """Let later callers start a new call, e.g. after a write.
+
+        Callers already waiting still get the running call's result.
+        """
+        with self._lock:
+            flight = self._flights.pop(key, None)
+            if flight is not None:
+                flight.forgotten = True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "collapsed": self.collapsed
+            }
@@ -0,0 +1,228 @@
+"""Shared MongoDB client and collections.
+
+Nothing here touches pymongo, dotenv or the network at import: settings
+are read and the client is built on the first get_client() call, so cold
+starts that never reach the database do not pay for them.
+"""
+import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pymongo import MongoClient
+    from pymongo.collection import Collection
+    from pymongo.database import Database
+
+ASCENDING = 1
+DESCENDING = -1
+
+# MongoDB setup. Read from the environment (and .env) on first use;
+# assigning a value before then takes precedence.
+MONGODB_URI = None
+DATABASE_NAME = None
+
+# Pool tuning. Serverless functions handle one request at a time, so a small
+# pool with a warm connection kept around is enough; the WSGI app can raise it.
+MAX_POOL_SIZE = None
+MIN_POOL_SIZE = None
+MAX_IDLE_TIME_MS = None
+CONNECT_TIMEOUT_MS = None
+SERVER_SELECTION_TIMEOUT_MS = None
+
+# Indexes the request paths rely on, as (keys, options) for IndexModel
+USER_INDEXES = [
+    ([('email', ASCENDING)], {'unique': True}),
+    ([('trial_expires', ASCENDING)], {}),
+    ([('country', ASCENDING)], {}),
+    # Range paging for the trial sweeper
+    ([('subscription_status', ASCENDING), ('trial_expires', ASCENDING), ('_id', ASCENDING)], {})
+]
+
+# Ingested job postings are deduplicated on their content hash
+JOB_INDEXES = [
+    ([('content_hash', ASCENDING)], {'unique': True})
+]
+
+MATCH_INDEXES = [
+    ([('email', ASCENDING), ('content_hash', ASCENDING)], {'unique': True})
+]
+
+# Finished runs are kept for a day so any worker can answer a poll
+RUN_INDEXES = [
+    ([('run_id', ASCENDING)], {'unique': True}),
+    ([('finished_at', ASCENDING)], {'expireAfterSeconds': 86400})
+]
+
+# Analytics counters: one per (metric, country, key), read top-N by count
+# or by key range
+ANALYTICS_INDEXES = [
+    ([('metric', ASCENDING), ('country', ASCENDING), ('key', ASCENDING)], {'unique': True}),
+    ([('metric', ASCENDING), ('country', ASCENDING), ('count', DESCENDING)], {})
+]
+
+COLLECTION_INDEXES = {
+    'users': USER_INDEXES,
+    'jobs': JOB_INDEXES,
+    'matches': MATCH_INDEXES,
+    'runs': RUN_INDEXES,
+    'analytics': ANALYTICS_INDEXES
+}
+
+_client: 'MongoClient' = None
+_client_pid: int = None
+_lock = threading.Lock()
+_listeners: list = []
+_configured = False
+
+
+def configure() -> None:
+    """Load .env and fill in every setting not assigned explicitly."""
+    global _configured, MONGODB_URI, DATABASE_NAME, MAX_POOL_SIZE, MIN_POOL_SIZE
+    global MAX_IDLE_TIME_MS, CONNECT_TIMEOUT_MS, SERVER_SELECTION_TIMEOUT_MS
+    if _configured:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if MONGODB_URI is None:
+        MONGODB_URI = os.getenv('MONGODB_URI')
+    if DATABASE_NAME is None:
+        DATABASE_NAME = os.getenv('MONGODB_DATABASE', 'jobhunter')
+    if MAX_POOL_SIZE is None:
+        MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', '10'))
+    if MIN_POOL_SIZE is None:
+        MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', '1'))
+    if MAX_IDLE_TIME_MS is None:
+        MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', '300000'))
+    if CONNECT_TIMEOUT_MS is None:
+        CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '5000'))
+    if SERVER_SELECTION_TIMEOUT_MS is None:
+        SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    _configured = True
+
+
+def register_listener(listener) -> None:
+    """Attach a pymongo event listener to every client built from now on."""
+    _listeners.append(listener)
+
+
+def get_client() -> 'MongoClient':
+    """Return the process-wide client, creating it on first use.
+
+    The client is reused across invocations for as long as the process (or
+    serverless container) stays warm. A forked child never reuses the
+    parent's client; it builds its own on first use.
+    """
+    global _client, _client_pid
+    client = _client
+    if client is not None and _client_pid == os.getpid():
+        return client
+
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            configure()
+            if not MONGODB_URI:
+                raise ValueError("No MONGODB_URI found in environment variables")
+            # Importing pymongo pulls in dnspython and bson; building the
+            # client resolves mongodb+srv:// records
+            from pymongo import MongoClient
+            _client = MongoClient(
+                MONGODB_URI,
+                maxPoolSize=MAX_POOL_SIZE,
+                minPoolSize=MIN_POOL_SIZE,
+                maxIdleTimeMS=MAX_IDLE_TIME_MS,
+                connectTimeoutMS=CONNECT_TIMEOUT_MS,
+                serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS,
+                retryWrites=True,
+                appname='jobhunter',
+                event_listeners=list(_listeners),
+                connect=False
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def get_database() -> 'Database':
+    client = get_client()
+    return client[DATABASE_NAME]
+
+
+def get_users_collection() -> 'Collection':
+    return get_database().users
+
+
+def get_jobs_collection() -> 'Collection':
+    return get_database().jobs
+
+
+def get_matches_collection() -> 'Collection':
+    return get_database().matches
+
+
+def get_runs_collection() -> 'Collection':
+    return get_database().runs
+
+
+def get_analytics_collection() -> 'Collection':
+    return get_database().analytics
+
+
+def ensure_indexes() -> None:
+    """Create the indexes if missing and check users.email is unique.
+
+    create_indexes is a no-op for indexes that already exist, so this is
+    cheap to run on every startup.
+    """
+    from pymongo import IndexModel
+
+    db = get_database()
+    try:
+        for name, indexes in COLLECTION_INDEXES.items():
+            db[name].create_indexes([IndexModel(keys, **options) for keys, options in indexes])
+    except Exception as e:
+        raise Exception(f"Failed to create indexes: {str(e)}")
+
+    for index in db.users.index_information().values():
+        if list(index.get('key', [])) == [('email', ASCENDING)] and index.get('unique'):
+            return
+    raise Exception("Unique index on users.email is missing")
+
+
+def use_client(client: 'MongoClient') -> None:
+    """Install an already built client, e.g. mongomock for benchmarks."""
+    global _client, _client_pid
+    configure()
+    with _lock:
+        _client = client
+        _client_pid = os.getpid()
+
+
+def reset_client() -> None:
+    """Forget the current client so the next call builds a fresh one.
+
+    Used after fork: the child must not touch sockets or monitor threads
+    inherited from the parent, so the old client is dropped, not closed.
+    """
+    global _client, _client_pid, _lock
+    _client = None
+    _client_pid = None
+    # A lock held by another thread at fork time would never be released
+    _lock = threading.Lock()
+
+
+def close_client() -> None:
+    global _client, _client_pid
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_client)
+
+
+if __name__ == '__main__':
+    ensure_indexes()
+    print("Indexes are in place")
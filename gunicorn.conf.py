@@ -0,0 +1,104 @@
+"""Production server settings for the Flask app.
+
+Run with: gunicorn -c gunicorn.conf.py
+
+One worker process per core, each with a pool of threads, so the box is
+used fully while requests wait on Mongo. With GUNICORN_PRELOAD (the
+default) the app is imported once in the master and workers are forked
+from it: the payment catalog, the validation tables and the job index
+are built once and shared copy-on-write. The Mongo client and the log
+writer are never shared; every worker builds its own after fork.
+
+Reloading:
+    kill -HUP <master>   new workers replace the old ones gracefully; with
+                         preload they still run the master's code
+    kill -USR2 <master>  then -TERM the old master, to deploy new code
+                         with zero downtime
+"""
+import gc
+import multiprocessing
+import os
+
+CORES = multiprocessing.cpu_count()
+
+wsgi_app = 'main:app'
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+
+workers = int(os.getenv('WEB_CONCURRENCY', str(CORES)))
+# Requests mostly wait on Mongo, so threads overlap that wait within a worker
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', str(max(2, min(8, CORES * 2)))))
+
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') != '0'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers now and then so slow leaks cannot build up; the jitter
+# keeps them from restarting all at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '1000'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+# Log file slot -> the worker last given it; only used in the master
+_log_slots = {}
+
+
+def _worker_log_path(slot: int) -> str:
+    import logging_config
+
+    root, ext = os.path.splitext(logging_config.LOG_FILE)
+    return f"{root}.{slot}{ext or '.log'}"
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # Build the read-only state in the master so workers inherit it;
+    # importing builds the payment catalog and the validation tables
+    import matching
+    import payments  # noqa: F401
+    import utils  # noqa: F401
+
+    matching.get_index()
+    # Leave what exists now out of GC passes; a pass would touch every
+    # object header and copy the shared pages into each worker
+    gc.freeze()
+    server.log.info("Preloaded app state shared with %s workers", workers)
+
+
+def pre_fork(server, worker):
+    # A recycled worker's replacement takes over its slot and file, so
+    # there are only ever as many files as workers running at once
+    live = list(server.WORKERS.values())
+    slot = 0
+    while slot in _log_slots and _log_slots[slot] in live:
+        slot += 1
+    _log_slots[slot] = worker
+    worker.log_slot = slot
+
+
+def post_fork(server, worker):
+    import database
+    import logging_config
+    import metrics
+
+    # The at-fork hooks already do this; calling them here keeps the
+    # guarantee explicit for anything built in the master
+    database.reset_client()
+    metrics.pool_timer.reset()
+    # Each live worker writes and rotates a file of its own
+    logging_config.restart_listener(_worker_log_path(worker.log_slot))
+
+
+def worker_exit(server, worker):
+    import database
+    import logging_config
+
+    logging_config.stop_logging()
+    database.close_client()
@@ -0,0 +1,224 @@
+"""Health status from driver monitoring instead of a ping per request.
+
+The Mongo driver already checks every server in the background with
+heartbeats. A listener on those events keeps the latest topology and
+heartbeat per server. status() builds the health report from that state
+and caches it for HEALTH_CACHE_TTL seconds. A health check therefore
+costs no database round trip unless deep=True is asked for, or the
+driver has not reported a topology yet.
+
+Other parts of the app add their own checks with register_check; main.py
+reports pool saturation and the rate limiter's storage this way.
+
+Like database, nothing here imports pymongo until install() is called,
+and install() must run before the client is built.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+import database
+
+HEALTHY = 'healthy'
+DEGRADED = 'degraded'
+UNHEALTHY = 'unhealthy'
+
+HEALTH_CACHE_TTL = float(os.getenv('HEALTH_CACHE_TTL', '2'))
+# A server not heard from for this long counts as stale; the driver's
+# default heartbeat interval is 10 seconds
+HEALTH_HEARTBEAT_STALE_SECONDS = float(os.getenv('HEALTH_HEARTBEAT_STALE_SECONDS', '30'))
+
+# Registered checks return (status, details)
+Check = Callable[[], Tuple[str, Dict[str, Any]]]
+
+_checks: Dict[str, Check] = {}
+_monitor = None
+_install_lock = threading.Lock()
+_cache_lock = threading.Lock()
+_cached: Optional[Tuple[float, Dict[str, Any]]] = None
+
+
+def _build_monitor():
+    from pymongo import monitoring
+
+    class TopologyMonitor(monitoring.ServerHeartbeatListener, monitoring.TopologyListener):
+        """Keeps the latest topology description and heartbeat per server."""
+
+        def __init__(self):
+            self.reset()
+
+        def reset(self) -> None:
+            self._lock = threading.Lock()
+            self.description = None
+            self.heartbeats: Dict[str, Dict[str, Any]] = {}
+
+        def _heartbeat(self, event, ok: bool, error: Optional[str] = None) -> None:
+            address = f"{event.connection_id[0]}:{event.connection_id[1]}"
+            with self._lock:
+                previous = self.heartbeats.get(address, {})
+                heartbeat = {"ok": ok, "at": time.time(), "error": error}
+                # An awaited (streaming) heartbeat waits for the server to
+                # report a change, so its duration is not a latency
+                if event.awaited:
+                    heartbeat['latency_ms'] = previous.get('latency_ms')
+                else:
+                    heartbeat['latency_ms'] = round(event.duration * 1000, 2)
+                self.heartbeats[address] = heartbeat
+
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            self._heartbeat(event, True)
+
+        def failed(self, event):
+            self._heartbeat(event, False, str(event.reply))
+
+        def opened(self, event):
+            pass
+
+        def description_changed(self, event):
+            with self._lock:
+                self.description = event.new_description
+
+        def closed(self, event):
+            with self._lock:
+                self.description = None
+
+        def snapshot(self):
+            with self._lock:
+                return self.description, dict(self.heartbeats)
+
+    return TopologyMonitor()
+
+
+def install() -> None:
+    """Register the topology listener with the clients database builds from now on."""
+    global _monitor
+    with _install_lock:
+        if _monitor is None:
+            _monitor = _build_monitor()
+            database.register_listener(_monitor)
+
+
+def register_check(name: str, check: Check) -> None:
+    """Add a check to every report; it runs at most once per HEALTH_CACHE_TTL."""
+    _checks[name] = check
+
+
+def _ping() -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        database.get_client().admin.command('ping')
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+def _database_status(deep: bool) -> Tuple[str, Dict[str, Any]]:
+    description, heartbeats = _monitor.snapshot() if _monitor is not None else (None, {})
+    details: Dict[str, Any] = {}
+
+    ping_ok = True
+    if deep or description is None:
+        # Also opens the client, after which the driver starts reporting
+        ping = _ping()
+        details['ping'] = ping
+        ping_ok = ping['ok']
+        if description is None:
+            description, heartbeats = _monitor.snapshot() if _monitor is not None else (None, {})
+            if description is None:
+                return (HEALTHY if ping_ok else UNHEALTHY), details
+
+    from pymongo import ReadPreference
+
+    now = time.time()
+    servers = {}
+    stale = False
+    for server in description.server_descriptions().values():
+        address = f"{server.address[0]}:{server.address[1]}"
+        heartbeat = heartbeats.get(address, {})
+        age = now - heartbeat['at'] if 'at' in heartbeat else None
+        latency = heartbeat.get('latency_ms')
+        if latency is None and server.round_trip_time is not None:
+            latency = round(server.round_trip_time * 1000, 2)
+        if server.is_server_type_known and (age is None or age > HEALTH_HEARTBEAT_STALE_SECONDS):
+            stale = True
+        servers[address] = {
+            "type": server.server_type_name,
+            "heartbeat_latency_ms": latency,
+            "heartbeat_age_s": round(age, 1) if age is not None else None,
+            "error": heartbeat.get('error') if not heartbeat.get('ok', True) else None
+        }
+
+    details.update({
+        "topology": description.topology_type_name,
+        "writable": description.has_writable_server(),
+        # The default read preference is primary, which would make this
+        # the same as writable
+        "readable": description.has_readable_server(ReadPreference.SECONDARY_PREFERRED),
+        "servers": servers
+    })
+    if not ping_ok:
+        return UNHEALTHY, details
+    if not details['writable']:
+        # Signups need a primary; status lookups can still be served
+        return (DEGRADED if details['readable'] else UNHEALTHY), details
+    return (DEGRADED if stale else HEALTHY), details
+
+
+_RANK = {HEALTHY: 0, DEGRADED: 1, UNHEALTHY: 2}
+
+
+def _build(deep: bool) -> Dict[str, Any]:
+    overall, database_details = _database_status(deep)
+    report: Dict[str, Any] = {"database": dict(database_details, status=overall)}
+    for name, check in list(_checks.items()):
+        try:
+            status, details = check()
+        except Exception as e:
+            status, details = DEGRADED, {"error": str(e)}
+        report[name] = dict(details, status=status)
+        if _RANK[status] > _RANK[overall]:
+            overall = status
+
+    report['status'] = overall
+    report['deep'] = deep
+    report['timestamp'] = datetime.utcnow().isoformat()
+    return report
+
+
+def status(deep: bool = False) -> Dict[str, Any]:
+    """The health report, from cache unless deep or older than HEALTH_CACHE_TTL."""
+    global _cached
+    cached = _cached
+    if not deep and cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_TTL:
+        return cached[1]
+    with _cache_lock:
+        # Another caller may have refreshed it while this one waited
+        cached = _cached
+        if not deep and cached is not None and time.monotonic() - cached[0] < HEALTH_CACHE_TTL:
+            return cached[1]
+        report = _build(deep)
+        _cached = (time.monotonic(), report)
+        return report
+
+
+def http_status(report: Dict[str, Any]) -> int:
+    """200 while traffic can be served, 503 for load balancers to route around."""
+    return 503 if report['status'] == UNHEALTHY else 200
+
+
+def _reset_after_fork() -> None:
+    # The child builds its own client; the parent's topology is not its own
+    global _cached, _cache_lock, _install_lock
+    _cached = None
+    _cache_lock = threading.Lock()
+    _install_lock = threading.Lock()
+    if _monitor is not None:
+        _monitor.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
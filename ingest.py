@@ -0,0 +1,338 @@
+"""Streaming job-feed ingestion.
+
+Postings flow through generator stages, so memory stays flat no matter
+how large the feed is:
+
+    read -> normalize -> dedup -> persist (bulk) -> match (incremental)
+
+Run with: python ingest.py feed.ndjson [more feeds...]
+Feeds may be NDJSON (.ndjson/.jsonl), CSV (.csv) or RSS/Atom (.rss/.xml).
+"""
+import argparse
+from collections import OrderedDict
+import csv
+from datetime import datetime
+import hashlib
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import xml.etree.ElementTree as ET
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import database
+import matching
+import utils
+
+# Postings per bulk_write
+BATCH_SIZE = 500
+
+# Content hashes remembered in memory; older ones are caught by the
+# unique index on jobs.content_hash instead
+SEEN_HASHES = 100000
+
+# How often progress is written to stderr, in seconds
+REPORT_INTERVAL = 5.0
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+SPACE_PATTERN = re.compile(r'\s+')
+
+# Feed field names that map onto each posting field
+FIELD_ALIASES = {
+    'title': ('title', 'job_title', 'position'),
+    'company': ('company', 'company_name', 'employer', 'author'),
+    'location': ('location', 'city', 'job_location'),
+    'country': ('country',),
+    'description': ('description', 'summary', 'content', 'body'),
+    'url': ('url', 'link', 'apply_url', 'id'),
+    'posted_at': ('posted_at', 'date', 'pubdate', 'published', 'updated')
+}
+
+
+class IngestStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.read = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.inserted = 0
+        self.matches = 0
+        self._last_report = self.started
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"read={self.read} invalid={self.invalid} duplicates={self.duplicates} "
+            f"inserted={self.inserted} matches={self.matches} "
+            f"rate={self.rate():.0f} postings/sec"
+        )
+
+    def maybe_report(self) -> None:
+        now = time.monotonic()
+        if now - self._last_report >= REPORT_INTERVAL:
+            self._last_report = now
+            print(self.summary(), file=sys.stderr)
+
+
+# Stage 1: read raw records
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1].lower()
+
+
+def read_rss(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield RSS <item> and Atom <entry> elements as flat dicts."""
+    # Open elements, outermost first; the last one is the parent of the
+    # element being closed
+    open_elements = []
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            open_elements.append(elem)
+            continue
+        open_elements.pop()
+        if _local_name(elem.tag) not in ('item', 'entry'):
+            continue
+        record = {}
+        for child in elem:
+            name = _local_name(child.tag)
+            if name == 'link' and child.get('href'):
+                record[name] = child.get('href')
+            elif child.text:
+                record.setdefault(name, child.text)
+        yield record
+        # Detach the item from its parent (RSS <channel>, Atom <feed>) so
+        # the tree never holds the whole feed
+        elem.clear()
+        if open_elements:
+            open_elements[-1].remove(elem)
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    lower = path.lower()
+    if lower.endswith(('.rss', '.xml', '.atom')):
+        yield from read_rss(path)
+        return
+
+    with open(path, encoding='utf-8', newline='') as f:
+        if lower.endswith('.csv'):
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield {}
+                continue
+            yield record if isinstance(record, dict) else {}
+
+
+# Stage 2: normalize
+
+def _clean(value: Any) -> str:
+    if value is None:
+        return ''
+    return SPACE_PATTERN.sub(' ', TAG_PATTERN.sub(' ', str(value))).strip()
+
+
+def normalize(records: Iterable[Dict[str, Any]], stats: IngestStats, source: str) -> Iterator[Dict[str, Any]]:
+    for record in records:
+        stats.read += 1
+        lowered = {str(key).lower(): value for key, value in record.items()}
+        posting = {'source': source}
+        for field, aliases in FIELD_ALIASES.items():
+            posting[field] = next(
+                (_clean(lowered[alias]) for alias in aliases if lowered.get(alias)),
+                ''
+            )
+        if not posting['title']:
+            stats.invalid += 1
+            continue
+        yield posting
+
+
+# Stage 3: dedup
+
+def content_hash(posting: Dict[str, Any]) -> str:
+    key = '\x1f'.join(
+        posting[field].lower() for field in ('title', 'company', 'location', 'description')
+    )
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def dedup(postings: Iterable[Dict[str, Any]], stats: IngestStats, capacity: int = SEEN_HASHES) -> Iterator[Dict[str, Any]]:
+    seen: "OrderedDict[str, None]" = OrderedDict()
+    for posting in postings:
+        digest = content_hash(posting)
+        if digest in seen:
+            seen.move_to_end(digest)
+            stats.duplicates += 1
+            continue
+        seen[digest] = None
+        if len(seen) > capacity:
+            seen.popitem(last=False)
+        posting['content_hash'] = digest
+        yield posting
+
+
+# Stage 4: persist in bulk
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def persist(batches: Iterable[List[Dict[str, Any]]], stats: IngestStats) -> Iterator[Dict[str, Any]]:
+    """Insert each batch and yield only postings that were new to the store."""
+    collection = database.get_jobs_collection()
+    for batch in batches:
+        ingested_at = datetime.utcnow()
+        requests = [
+            UpdateOne(
+                {'content_hash': posting['content_hash']},
+                {'$setOnInsert': dict(posting, ingested_at=ingested_at)},
+                upsert=True
+            )
+            for posting in batch
+        ]
+        try:
+            inserted = collection.bulk_write(requests, ordered=False).upserted_ids
+        except BulkWriteError as e:
+            # Concurrent ingests can race on the unique index; those lose
+            inserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+
+        stats.duplicates += len(batch) - len(inserted)
+        stats.inserted += len(inserted)
+        for index in sorted(inserted):
+            yield batch[index]
+        stats.maybe_report()
+
+
+# Stage 5: match new postings against subscribed users
+
+class KeywordSubscriptions:
+    """Users' keyword phrases, indexed by their first term.
+
+    A phrase matches a posting when all of its terms appear in it, so each
+    new posting only looks at phrases that start with one of its terms.
+    """
+
+    def __init__(self):
+        self._phrases: Dict[str, List[Tuple[str, Tuple[str, ...], str]]] = {}
+
+    def add_user(self, email: str, keywords: Any) -> None:
+        if isinstance(keywords, str):
+            keywords = keywords.split(',')
+        for keyword in keywords or []:
+            if not isinstance(keyword, str):
+                continue
+            terms = tuple(dict.fromkeys(matching.tokenize(keyword)))
+            if terms:
+                self._phrases.setdefault(terms[0], []).append((email, terms, keyword.strip()))
+
+    def match(self, posting: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Return {email: [matched keywords]} for one posting."""
+        terms = set(matching.posting_tokens(posting))
+        matched: Dict[str, List[str]] = {}
+        for term in terms:
+            for email, phrase, keyword in self._phrases.get(term, ()):
+                if all(t in terms for t in phrase[1:]):
+                    matched.setdefault(email, []).append(keyword)
+        return matched
+
+
+def load_subscriptions(batch_size: int = 1000) -> KeywordSubscriptions:
+    """Index the keywords of users on an active trial or a paid plan."""
+    subscriptions = KeywordSubscriptions()
+    cursor = database.get_users_collection().find(
+        {'$or': [
+            {'trial_expires': {'$gt': datetime.utcnow()}},
+            {'subscription_status': {'$in': list(utils.PAID_STATUSES)}}
+        ]},
+        {'_id': 0, 'email': 1, 'job_keywords': 1},
+        batch_size=batch_size
+    )
+    for user in cursor:
+        subscriptions.add_user(user['email'], user.get('job_keywords'))
+    return subscriptions
+
+
+def match_postings(postings: Iterable[Dict[str, Any]], subscriptions: KeywordSubscriptions,
+                   stats: IngestStats, batch_size: int = BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+    """Record matches for each new posting and pass the posting through."""
+    collection = database.get_matches_collection()
+    pending = []
+
+    def flush():
+        if pending:
+            try:
+                collection.bulk_write(pending, ordered=False)
+            except BulkWriteError:
+                pass  # Already-recorded matches hit the unique index
+            pending.clear()
+
+    for posting in postings:
+        for email, keywords in subscriptions.match(posting).items():
+            stats.matches += 1
+            pending.append(UpdateOne(
+                {'email': email, 'content_hash': posting['content_hash']},
+                {'$setOnInsert': {
+                    'title': posting['title'],
+                    'company': posting['company'],
+                    'url': posting['url'],
+                    'matched_keywords': keywords,
+                    'matched_at': datetime.utcnow()
+                }},
+                upsert=True
+            ))
+        if len(pending) >= batch_size:
+            flush()
+        yield posting
+    flush()
+
+
+def ingest(paths: Iterable[str], batch_size: int = BATCH_SIZE, corpus: Optional[str] = None) -> IngestStats:
+    """Run every feed through the pipeline and return the final counters.
+
+    With corpus set, newly stored postings are also appended there as
+    NDJSON so matching.get_index() picks them up.
+    """
+    stats = IngestStats()
+    subscriptions = load_subscriptions()
+    corpus_file = open(corpus, 'a', encoding='utf-8') if corpus else None
+    try:
+        for path in paths:
+            postings = normalize(read_records(path), stats, source=path)
+            stored = persist(batched(dedup(postings, stats), batch_size), stats)
+            for posting in match_postings(stored, subscriptions, stats, batch_size):
+                if corpus_file:
+                    record = dict(posting, id=posting['content_hash'])
+                    corpus_file.write(json.dumps(record, default=str) + '\n')
+    finally:
+        if corpus_file:
+            corpus_file.close()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ingest job postings from feed dumps")
+    parser.add_argument('paths', nargs='+', help="NDJSON, CSV or RSS files")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--corpus', help="Also append new postings to this NDJSON file")
+    args = parser.parse_args()
+
+    database.ensure_indexes()
+    result = ingest(args.paths, batch_size=args.batch_size, corpus=args.corpus)
+    print(result.summary())
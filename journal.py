@@ -0,0 +1,370 @@
+"""Write-behind signup journal.
+
+With SIGNUP_WRITE_BEHIND=1, /api/signup appends the user to a local
+append-only journal and answers as soon as the line is on disk; a
+background flusher then group-commits journaled users to Mongo through
+utils.save_users. Until a user is committed, lookups are answered from
+the journal's pending map, so a status check right after signup still
+finds them.
+
+Durability: appenders share fsyncs (group commit), so a signup is only
+acknowledged once it would survive a crash. Each process writes its own
+journal segments and holds an flock on every one it has not committed
+yet. A segment nobody holds a lock on was left by a process that died,
+and is replayed to Mongo when the next journal starts.
+
+Only long-lived servers should enable this: a serverless instance may
+be frozen or discarded right after responding, with its disk.
+"""
+import atexit
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SIGNUP_WRITE_BEHIND = os.getenv('SIGNUP_WRITE_BEHIND', '0') == '1'
+SIGNUP_JOURNAL_DIR = os.getenv('SIGNUP_JOURNAL_DIR', 'journal')
+# The flusher commits at least this often, or sooner once a batch is full
+SIGNUP_FLUSH_INTERVAL = float(os.getenv('SIGNUP_FLUSH_INTERVAL', '0.05'))
+SIGNUP_FLUSH_BATCH = int(os.getenv('SIGNUP_FLUSH_BATCH', '500'))
+# Failed commits of one segment before each further failure is logged at
+# error level; the flusher keeps retrying it regardless
+SIGNUP_ALERT_ATTEMPTS = int(os.getenv('SIGNUP_ALERT_ATTEMPTS', '20'))
+# Longest pause between retries of a failing commit, in seconds
+SIGNUP_MAX_BACKOFF = float(os.getenv('SIGNUP_MAX_BACKOFF', '5'))
+
+SEGMENT_PREFIX = 'signups.'
+SEGMENT_SUFFIX = '.ndjson'
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat()}
+    raise TypeError(f"Cannot journal {type(value).__name__}")
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and '$date' in obj:
+        return datetime.fromisoformat(obj['$date'])
+    return obj
+
+
+def _lock(f) -> bool:
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def read_segment(f) -> List[Dict[str, Any]]:
+    users = []
+    for line in f:
+        try:
+            users.append(json.loads(line, object_hook=_decode))
+        except ValueError:
+            # A torn last line was never acknowledged
+            continue
+    return users
+
+
+class Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        _lock(self.file)
+        self.users: List[Dict[str, Any]] = []
+        self.attempts = 0
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class SignupJournal:
+    def __init__(self, directory: str = SIGNUP_JOURNAL_DIR, flush_interval: float = SIGNUP_FLUSH_INTERVAL,
+                 flush_batch: int = SIGNUP_FLUSH_BATCH):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        os.makedirs(directory, exist_ok=True)
+
+        self._prefix = f"{SEGMENT_PREFIX}{os.getpid()}.{uuid.uuid4().hex[:8]}."
+        self._next_segment = 0
+        self._lock = threading.Lock()
+        # Appenders wait here for the fsync in progress to cover their line
+        self._synced_cond = threading.Condition(threading.Lock())
+        self._syncing = False
+        self._wake = threading.Condition(self._lock)
+        self._written = 0
+        self._synced = 0
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._sealed: List[Segment] = []
+        self._closed = False
+        self.committed = 0
+        self.commits = 0
+        self.replayed = 0
+
+        self._segment = self._open_segment()
+        self._flusher = threading.Thread(target=self._run, name='signup-journal', daemon=True)
+        self._flusher.start()
+
+    def _open_segment(self) -> Segment:
+        path = os.path.join(self.directory, f"{self._prefix}{self._next_segment:06d}{SEGMENT_SUFFIX}")
+        self._next_segment += 1
+        return Segment(path)
+
+    # Appending
+
+    def append(self, user: Dict[str, Any]) -> None:
+        """Journal user durably; returns once it is fsynced."""
+        line = json.dumps(user, default=_encode) + '\n'
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Signup journal is closed")
+            segment = self._segment
+            segment.file.write(line)
+            segment.users.append(user)
+            self._pending[user['email']] = user
+            self._written += 1
+            seq = self._written
+            if len(segment.users) >= self.flush_batch:
+                self._wake.notify()
+        self._sync(seq, segment)
+
+    def _sync(self, seq: int, segment: Segment) -> None:
+        # Group commit: one appender at a time fsyncs everything written so
+        # far, and the rest wait for it instead of queueing for their own
+        if self._synced >= seq:
+            return
+        with self._synced_cond:
+            while self._synced < seq:
+                if not self._syncing:
+                    self._syncing = True
+                    break
+                self._synced_cond.wait()
+            else:
+                return
+        synced = self._synced
+        try:
+            with self._lock:
+                target = self._written
+                files = [s.file for s in self._sealed if not s.file.closed] + [self._segment.file]
+            for f in files:
+                try:
+                    f.flush()
+                    os.fsync(f.fileno())
+                except ValueError:
+                    pass  # committed and closed meanwhile; already in Mongo
+            synced = target
+        finally:
+            # On an fsync error nothing new counts as synced; the next
+            # waiter tries again
+            with self._synced_cond:
+                self._synced = synced
+                self._syncing = False
+                self._synced_cond.notify_all()
+
+    def pending_user(self, email: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = self._pending.get(email)
+        return dict(user) if user is not None else None
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # Flushing
+
+    def _seal(self) -> None:
+        # Called with the lock held
+        if self._segment.users:
+            self._sealed.append(self._segment)
+            self._segment = self._open_segment()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._closed and len(self._segment.users) < self.flush_batch:
+                    self._wake.wait(self.flush_interval)
+                self._seal()
+                sealed = list(self._sealed)
+                closed = self._closed
+            for segment in sealed:
+                if not self._commit(segment):
+                    break
+            if closed:
+                return
+            if sealed and self._sealed:
+                self._back_off(self._sealed[0].attempts)
+
+    def _back_off(self, attempts: int) -> None:
+        # A commit failed; wait longer after each failure instead of
+        # spinning, but wake at once for close()
+        delay = min(SIGNUP_MAX_BACKOFF, self.flush_interval * 10 * 2 ** min(attempts - 1, 16))
+        with self._lock:
+            if not self._closed:
+                self._wake.wait(delay)
+
+    def _commit(self, segment: Segment) -> bool:
+        import utils
+
+        # Segments are fsynced before their lines leave the journal
+        segment.file.flush()
+        os.fsync(segment.file.fileno())
+        try:
+            results = utils.save_users(segment.users, chunk_size=max(self.flush_batch, 1))
+            failed = [result for result in results if result['status'] == 'failed']
+        except Exception as e:
+            failed = [{"error": str(e)}]
+
+        if failed:
+            # These signups were acknowledged, so they stay pending (and
+            # visible to lookups) until a retry stores them
+            segment.attempts += 1
+            level = logging.ERROR if segment.attempts >= SIGNUP_ALERT_ATTEMPTS else logging.WARNING
+            logger.log(level, "Signup journal commit of %d signups failed (attempt %d): %s",
+                       len(segment.users), segment.attempts, failed[0].get('error'))
+            return False
+
+        os.remove(segment.path)
+        self.committed += len(segment.users)
+        self.commits += 1
+        # New users are stored exactly as journaled, so the read cache
+        # can take them without another query
+        for user, result in zip(segment.users, results):
+            if result['status'] == 'created':
+                utils.cache_user(user)
+
+        with self._lock:
+            self._sealed.remove(segment)
+            for user in segment.users:
+                # A newer signup for the same email is still pending
+                if self._pending.get(user['email']) is user:
+                    del self._pending[user['email']]
+        segment.close()
+        return True
+
+    # Recovery
+
+    def replay_orphans(self) -> int:
+        """Commit segments left behind by processes that died."""
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            if name.startswith(self._prefix):
+                continue
+            replayed += self._replay_segment(os.path.join(self.directory, name))
+        if replayed:
+            logger.info("Replayed %d journaled signups", replayed)
+        self.replayed += replayed
+        return replayed
+
+    def _replay_segment(self, path: str) -> int:
+        import utils
+
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return 0  # another process replayed it first
+        with f:
+            if not _lock(f):
+                return 0  # its process is alive
+            if os.fstat(f.fileno()).st_nlink == 0:
+                return 0  # replayed and removed since we opened it
+            # Read what the lock covers, through the locked handle
+            users = read_segment(f)
+            if users:
+                results = utils.save_users(users, chunk_size=max(self.flush_batch, 1))
+                failed = sum(1 for result in results if result['status'] == 'failed')
+                if failed:
+                    logger.error("Replay of %s failed for %d of %d signups; will retry on next start",
+                                 path, failed, len(users))
+                    return 0
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(users)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Commit what is pending and stop the flusher."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        self._flusher.join(timeout)
+        with self._lock:
+            leftover = self._segment
+            uncommitted = list(self._sealed)
+        if uncommitted:
+            logger.error("Signup journal closed with %d acknowledged signups uncommitted; "
+                         "they will be replayed on the next start", sum(len(s.users) for s in uncommitted))
+            for segment in uncommitted:
+                segment.close()
+        if not leftover.users:
+            leftover.close()
+            if os.path.exists(leftover.path):
+                os.remove(leftover.path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "segments": len(self._sealed) + 1,
+                "committed": self.committed,
+                "commits": self.commits,
+                "replayed": self.replayed
+            }
+
+
+_journal: Optional[SignupJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> SignupJournal:
+    """Return this process's journal, starting it (and replaying orphans) on first use."""
+    global _journal
+    if _journal is not None:
+        return _journal
+    with _journal_lock:
+        if _journal is None:
+            journal = SignupJournal()
+            try:
+                journal.replay_orphans()
+            except Exception as e:
+                logger.warning("Signup journal replay failed: %s", e)
+            atexit.register(journal.close)
+            _journal = journal
+        return _journal
+
+
+def pending_user(email: str) -> Optional[Dict[str, Any]]:
+    """The journaled, not yet committed user for email, if any."""
+    journal = _journal
+    return journal.pending_user(email) if journal is not None else None
+
+
+def _reset_after_fork() -> None:
+    # The flusher thread is gone and the parent's locked segments are not
+    # ours; the child starts a journal of its own on first use
+    global _journal, _journal_lock
+    _journal = None
+    _journal_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,216 @@
+"""Non-blocking structured logging.
+
+Request threads only put records on an in-memory queue; a background
+QueueListener formats them as JSON lines and writes them to a rotating
+file. The file is opened and the thread started with the first record,
+not at import. Repeated records at the same level are sampled during error storms,
+and every record carries the id of the request that produced it.
+"""
+import atexit
+import contextvars
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+# Per level: (records let through per window for one message, then 1 in N)
+SAMPLING = {
+    logging.WARNING: (20, 10),
+    logging.ERROR: (20, 10),
+    logging.CRITICAL: (100, 1)
+}
+SAMPLING_WINDOW = 60.0
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar('request_id', default=None)
+
+
+def bind_request_id(request_id: Optional[str]) -> None:
+    request_id_var.set(request_id)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp the current request id on the record in the calling thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Let the first records of a message through, then only 1 in N.
+
+    Counts are kept per (level, message template) and reset every window,
+    so a storm of one error cannot flood the log or the queue.
+    """
+
+    def __init__(self, sampling: Dict[int, Tuple[int, int]] = SAMPLING, window: float = SAMPLING_WINDOW):
+        super().__init__()
+        self.sampling = sampling
+        self.window = window
+        self._counts: Dict[Tuple[int, str], int] = {}
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rule = self.sampling.get(record.levelno)
+        if rule is None:
+            return True
+        burst, every = rule
+        key = (record.levelno, str(record.msg))
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._counts.clear()
+                self._window_start = now
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            if count <= burst or (count - burst) % every == 0:
+                if count > burst:
+                    record.sampled = every
+                return True
+            self.dropped += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when full.
+
+    on_first_record, if given, is called once before the first record is
+    queued, so the writer is only started when there is something to write.
+    """
+
+    def __init__(self, log_queue: queue.Queue, on_first_record: Optional[Callable[[], None]] = None):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.on_first_record = on_first_record
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merge args here; JSON formatting happens on the listener thread
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self.on_first_record is not None:
+            start, self.on_first_record = self.on_first_record, None
+            start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat() + 'Z',
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, 'request_id', None),
+            "module": record.module,
+            "line": record.lineno
+        }
+        if getattr(record, 'sampled', None):
+            entry['sampled'] = record.sampled
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener_lock = threading.Lock()
+_log_path = LOG_FILE
+
+
+def _build_file_handler(path: str = LOG_FILE) -> logging.Handler:
+    handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    handler.setFormatter(JsonFormatter())
+    handler.setLevel(logging.INFO)
+    return handler
+
+
+def _start_listener() -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is None and _queue_handler is not None:
+            _listener = QueueListener(_queue_handler.queue, _build_file_handler(_log_path), respect_handler_level=True)
+            _listener.start()
+
+
+def setup_logging(logger: logging.Logger, level: int = logging.INFO) -> None:
+    """Route logger, and every module logger, through the queue.
+
+    The queue handler goes on the root logger, so the loggers of
+    analytics, journal, health and the rest get the same sampling,
+    request ids and JSON lines as the app's own; without a handler they
+    would reach Python's last-resort stderr handler on the request
+    thread. The writer starts with the first record.
+    """
+    global _queue_handler
+    if _queue_handler is not None:
+        return
+
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(log_queue, on_first_record=_start_listener)
+    _queue_handler.addFilter(SamplingFilter())
+    _queue_handler.addFilter(RequestIdFilter())
+    _queue_handler.setLevel(level)
+
+    # Flask's default handler writes to stderr on the request thread;
+    # the queue must be the only path
+    from flask.logging import default_handler
+    logger.removeHandler(default_handler)
+
+    logger.setLevel(level)
+    root = logging.getLogger()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    if not logger.propagate:
+        logger.addHandler(_queue_handler)
+    atexit.register(stop_logging)
+
+
+def restart_listener(path: str = LOG_FILE) -> None:
+    """Start a fresh writer, e.g. in a forked worker.
+
+    Threads do not survive fork, so the child's queue would otherwise
+    fill up and silently drop everything. Processes sharing one file
+    would also race on rotation, so workers pass a path of their own.
+    """
+    global _listener, _listener_lock, _log_path
+    if _queue_handler is None:
+        return
+    # The parent's writer thread and lock are not ours to use or close
+    _listener = None
+    _listener_lock = threading.Lock()
+    _log_path = path
+    _queue_handler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler.on_first_record = _start_listener
+
+
+def stop_logging() -> None:
+    global _listener
+    if _listener is not None:
+        try:
+            _listener.stop()
+        finally:
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
@@ -1,18 +1,32 @@
-from flask import Flask, request, jsonify
+from dotenv import load_dotenv
+
+# Load .env before the modules below read their settings
+load_dotenv()
+
+from flask import Flask, g, request
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import datetime
+import admission
+import analytics
+import database
+import health
+import journal
 import utils
+import responses
+import schema
+import scheduler
+import sweeper
+import payments
+import ratelimit_storage
 import json
 import os
-from dotenv import load_dotenv
 from middleware import validate_request
-import logging
-from logging.handlers import RotatingFileHandler
-
-# Load environment variables
-load_dotenv()
+import uuid
+import logging_config
+import metrics
 
 app = Flask(__name__)
 
@@ -28,166 +42,474 @@ CORS(app, resources={
     }
 })
 
-# Configure rate limiting
+# Configure rate limiting. Counters default to a SQLite file shared by
+# every worker on the host; any limits URI (redis://, memcached://, ...)
+# can be used instead to share them between hosts.
+RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', ratelimit_storage.DEFAULT_URI)
+RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=RATELIMIT_STORAGE_URI,
+    strategy=RATELIMIT_STRATEGY,
+    # A busy or broken counter store lets requests through instead of
+    # failing them with a 500
+    swallow_errors=True
+)
+
+# Instrumentation
+metrics.instrument_app(app)
+health.install()
+
+# Share of the Mongo pool in use at which health reports degraded
+HEALTH_POOL_SATURATION = float(os.getenv('HEALTH_POOL_SATURATION', '0.9'))
+
+def pool_health():
+    size = database.MAX_POOL_SIZE or 0
+    saturation = metrics.pool_timer.in_use / size if size else 0.0
+    return (health.DEGRADED if saturation >= HEALTH_POOL_SATURATION else health.HEALTHY), {
+        "in_use": metrics.pool_timer.in_use,
+        "open": metrics.pool_timer.open,
+        "max_size": size,
+        "saturation": round(saturation, 2)
+    }
+
+def limiter_health():
+    ok = limiter.storage.check()
+    return (health.HEALTHY if ok else health.DEGRADED), {
+        "enabled": limiter.enabled,
+        "storage": RATELIMIT_STORAGE_URI.split(':', 1)[0],
+        "strategy": RATELIMIT_STRATEGY,
+        "storage_ok": ok
+    }
+
+health.register_check('pool', pool_health)
+health.register_check('rate_limiter', limiter_health)
+metrics.registry.gauge(
+    'user_cache_requests_total', 'User cache lookups by result',
+    lambda: {(('result', key),): utils.get_user_cache_stats()[key] for key in ('hits', 'misses')},
+    kind='counter'
+)
+metrics.registry.gauge(
+    'user_cache_evictions_total', 'User cache entries evicted for space',
+    lambda: utils.get_user_cache_stats()['evictions'],
+    kind='counter'
+)
+metrics.registry.gauge('user_cache_size', 'User cache entries', lambda: utils.get_user_cache_stats()['size'])
+metrics.registry.gauge(
+    'user_lookups_total', 'User queries sent to Mongo (leader) or served by one already in flight (collapsed)',
+    lambda: {(('result', 'leader' if key == 'leaders' else 'collapsed'),): utils.get_user_lookup_stats()[key]
+             for key in ('leaders', 'collapsed')},
+    kind='counter'
+)
+metrics.registry.gauge(
+    'user_lookups_in_flight', 'User queries currently in flight',
+    lambda: utils.get_user_lookup_stats()['in_flight']
+)
+metrics.registry.gauge(
+    'signup_journal_pending', 'Journaled signups not yet written to Mongo',
+    lambda: journal.get_journal().stats()['pending'] if journal.SIGNUP_WRITE_BEHIND else 0
+)
+metrics.registry.gauge(
+    'signup_journal_committed_total', 'Journaled signups written to Mongo',
+    lambda: journal.get_journal().stats()['committed'] if journal.SIGNUP_WRITE_BEHIND else 0,
+    kind='counter'
+)
+metrics.registry.gauge(
+    'run_scheduler_runs', 'Runs held by this worker by state',
+    lambda: {(('state', key),): value for key, value in scheduler.get_scheduler().stats().items()}
 )
 
-# Setup logging
+# Setup logging; the log file and writer thread are created with the
+# first record
 if not app.debug:
-    file_handler = RotatingFileHandler('app.log', maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(logging.Formatter(
-        '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-    ))
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
+    logging_config.setup_logging(app.logger)
+
+@app.before_request
+def assign_request_id():
+    request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    logging_config.bind_request_id(request_id[:64])
+
+def server_error(e):
+    """503 if the request ran out of its Mongo deadline, else 500."""
+    if admission.deadline_exceeded(e):
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        app.logger.warning("Deadline exceeded on %s: %s", route, e)
+        metrics.registry.inc('admission_deadline_exceeded_total', (('route', route),))
+        return admission.overloaded_response(reason='deadline_exceeded')
+    app.logger.error("Server error: %s", e)
+    return responses.constant(responses.INTERNAL_ERROR)
+
+@app.before_first_request
+def bootstrap_indexes():
     app.logger.info('JobHunter startup')
+    try:
+        utils.ensure_indexes()
+    except Exception as e:
+        # Serving traffic matters more than the index check; it is retried
+        # on the next start
+        app.logger.warning("Index bootstrap failed: %s", e)
+    # No-op unless SWEEP_INTERVAL is set; the CLI is the other way to run it
+    sweeper.start_in_process()
+    if journal.SIGNUP_WRITE_BEHIND:
+        # Starting the journal also replays any a crashed worker left behind
+        journal.get_journal()
 
 @app.route('/api/signup', methods=['POST'])
 @limiter.limit("5 per minute")
-@validate_request(['email', 'job_keywords', 'country'])
+@admission.admit(admission.NORMAL, limit=4, queue=8, wait=1.0, deadline=3.0)
+@validate_request(schema.SIGNUP)
 def signup():
     try:
-        data = request.json
-        
         # Data preparation
-        user = {
-            "email": data['email'],
-            "job_keywords": data['job_keywords'],
-            "country": data['country'],
-            "signup_date": datetime.utcnow().isoformat(),
-            "trial_active": True,
-            "subscription_status": "trial"
-        }
+        user = utils.build_user(g.payload)
         
         # Try to save user
         try:
-            utils.save_user(user)
+            utils.save_signup(user)
         except Exception as db_error:
-            app.logger.error(f"Database error: {str(db_error)}")
-            return jsonify({"error": "Failed to save user data"}), 500
+            if admission.deadline_exceeded(db_error):
+                return server_error(db_error)
+            app.logger.error("Database error: %s", db_error)
+            return responses.json_response({"error": "Failed to save user data"}, 500)
             
-        return jsonify({
+        return responses.json_response({
             "message": "Signup successful",
             "trial_end": utils.get_trial_end(user)
-        }), 201
+        }, 201)
     
     except Exception as e:
-        app.logger.error(f"Server error: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        return server_error(e)
+
+# Largest number of records accepted by one batch signup call
+MAX_BATCH_SIGNUPS = int(os.getenv('MAX_BATCH_SIGNUPS', '5000'))
+# A full batch of typical records fits comfortably
+MAX_BATCH_BODY_BYTES = int(os.getenv('MAX_BATCH_BODY_BYTES', str(4 * 1024 * 1024)))
+
+def parse_batch_body():
+    """Read a batch body sent either as a JSON array or as NDJSON."""
+    if 'ndjson' in (request.content_type or ''):
+        records = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Keep the position so the caller sees which line was bad
+                records.append(None)
+        return records
+
+    data = request.get_json(silent=True)
+    return data if isinstance(data, list) else None
+
+def read_batch():
+    """Return the batch's records, or raise schema.Invalid if it is refused."""
+    # Refused before the body is read
+    if (request.content_length or 0) > MAX_BATCH_BODY_BYTES:
+        raise schema.Invalid("Request body too large", 413)
+    records = parse_batch_body()
+    if records is None:
+        raise schema.Invalid("Expected a JSON array or NDJSON body")
+    if not records:
+        raise schema.Invalid("No data provided")
+    if len(records) > MAX_BATCH_SIGNUPS:
+        raise schema.Invalid(f"At most {MAX_BATCH_SIGNUPS} records per batch", 413)
+    return records
+
+def validate_batch(records):
+    """Validate records in place.
+
+    Returns the results so far (set for invalid and superseded records)
+    and the index of the record to save for each email.
+    """
+    results = [None] * len(records)
+    positions = {}
+    for index, record in enumerate(records):
+        try:
+            record = records[index] = schema.SIGNUP.validate(record)
+        except schema.Invalid as e:
+            results[index] = {"index": index, "status": "invalid", "error": e.message}
+            continue
+        # The last record for an email wins, as with repeated signups
+        previous = positions.get(record['email'])
+        if previous is not None:
+            results[previous] = {"index": previous, "email": record['email'], "status": "duplicate"}
+        positions[record['email']] = index
+    return results, positions
+
+@app.route('/api/signup/batch', methods=['POST'])
+@limiter.limit("10 per minute")
+@admission.admit(admission.LOW, limit=1, queue=2, wait=2.0, deadline=20.0, retry_after=10)
+def batch_signup():
+    try:
+        try:
+            records = read_batch()
+        except schema.Invalid as e:
+            return responses.json_response({"error": e.message}, e.status)
+
+        results, positions = validate_batch(records)
+        users = [utils.build_user(records[index]) for index in positions.values()]
+        try:
+            saved = utils.save_users(users)
+        except Exception as db_error:
+            if admission.deadline_exceeded(db_error):
+                return server_error(db_error)
+            app.logger.error("Database error: %s", db_error)
+            return responses.json_response({"error": "Failed to save user data"}, 500)
+
+        for index, user, result in zip(positions.values(), users, saved):
+            if result['status'] != 'failed':
+                result['trial_end'] = utils.get_trial_end(user)
+            results[index] = dict(result, index=index)
+
+        summary = dict(Counter(result['status'] for result in results))
+
+        return responses.json_response({"summary": summary, "results": results}, 200, compress=True)
+    except Exception as e:
+        return server_error(e)
 
 @app.route('/api/status')
 @limiter.limit("30 per minute")
+@admission.admit(admission.HIGH, limit=8, queue=16, wait=0.5, deadline=1.5)
 def trial_status():
     try:
         email = request.args.get('email')
         if not email or not utils.validate_email(email):
-            return jsonify({"error": "Valid email parameter is required"}), 400
+            return responses.constant(responses.INVALID_EMAIL)
             
-        user = utils.get_user(email)
+        user = utils.get_user(email, utils.STATUS_FIELDS)
         
         if not user:
-            return jsonify({"error": "User not found"}), 404
+            return responses.constant(responses.USER_NOT_FOUND)
         
-        return jsonify({
+        return responses.json_response({
             "trial_active": utils.is_trial_active(user),
             "trial_end": utils.get_trial_end(user)
-        }), 200
+        }, 200)
+    except Exception as e:
+        return server_error(e)
+
+# Largest number of emails accepted by one batch status call
+MAX_BATCH_STATUS = int(os.getenv('MAX_BATCH_STATUS', '500'))
+
+@app.route('/api/status/batch', methods=['POST'])
+@limiter.limit("30 per minute")
+@admission.admit(admission.NORMAL, limit=2, queue=4, wait=1.0, deadline=3.0)
+def batch_trial_status():
+    try:
+        data = request.get_json(silent=True)
+        emails = data.get('emails') if isinstance(data, dict) else None
+        if not isinstance(emails, list) or not emails:
+            return responses.json_response({"error": "A non-empty emails list is required"}, 400)
+        if len(emails) > MAX_BATCH_STATUS:
+            return responses.json_response({"error": f"At most {MAX_BATCH_STATUS} emails per batch"}, 413)
+
+        valid = [
+            email for email in emails
+            if isinstance(email, str) and utils.validate_email(email)
+        ]
+        users = utils.get_users(list(dict.fromkeys(valid)), utils.STATUS_FIELDS)
+
+        valid_emails = set(valid)
+        results = []
+        for email in emails:
+            if not isinstance(email, str) or email not in valid_emails:
+                results.append({"email": email, "error": "Invalid email format"})
+                continue
+            user = users.get(email)
+            if user is None:
+                results.append({"email": email, "error": "User not found"})
+            else:
+                results.append({
+                    "email": email,
+                    "trial_active": utils.is_trial_active(user),
+                    "trial_end": utils.get_trial_end(user)
+                })
+
+        return responses.json_response({"results": results}, 200, compress=True)
     except Exception as e:
-        app.logger.error(f"Server error: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        return server_error(e)
+
+# Number of job matches returned by a run
+RUN_TOP_K = int(os.getenv('RUN_TOP_K', '20'))
 
 @app.route('/api/run')
 @limiter.limit("10 per minute")
+@admission.admit(admission.LOW, limit=4, queue=4, wait=0.5, deadline=2.0, retry_after=5)
 def run_bot():
     try:
         email = request.args.get('email')
         if not email or not utils.validate_email(email):
-            return jsonify({"error": "Valid email parameter is required"}), 400
+            return responses.constant(responses.INVALID_EMAIL)
             
-        user = utils.get_user(email)
+        user = utils.get_user(email, utils.RUN_FIELDS)
         
         if not user:
-            return jsonify({"error": "User not found"}), 404
+            return responses.constant(responses.USER_NOT_FOUND)
         
         if utils.is_trial_active(user):
-            return jsonify({
-                "message": "Bot executed successfully",
+            try:
+                run = scheduler.submit_match(email, user.get('job_keywords'), RUN_TOP_K)
+            except scheduler.SchedulerFull:
+                return responses.json_response(
+                    {"error": "Too many runs in progress, try again shortly"}, 503,
+                    headers={'Retry-After': '5'}
+                )
+            return responses.json_response({
+                "message": "Bot run queued",
                 "status": "active",
+                "run_id": run.id,
+                "run_status": run.status,
+                "status_url": f"/api/run/{run.id}?email={email}",
                 "trial_end": utils.get_trial_end(user)
-            }), 200
+            }, 202)
         
-        return jsonify({
+        return responses.json_response({
             "error": "Trial expired. Please upgrade to continue.",
             "upgrade_url": f"/api/upgrade?email={email}"
-        }), 403
+        }, 403)
     except Exception as e:
-        app.logger.error(f"Server error: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        return server_error(e)
+
+@app.route('/api/run/<run_id>')
+@limiter.limit("60 per minute")
+@admission.admit(admission.NORMAL, limit=8, queue=8, wait=0.5, deadline=1.5)
+def run_result(run_id):
+    try:
+        email = request.args.get('email')
+        if not email or not utils.validate_email(email):
+            return responses.constant(responses.INVALID_EMAIL)
+
+        run = scheduler.load_run(run_id)
+        # Runs are only visible to the user they belong to
+        if not run or run.get('email') != email:
+            return responses.json_response({"error": "Run not found"}, 404)
+
+        return responses.json_response(run, 200)
+    except Exception as e:
+        return server_error(e)
 
 @app.route('/api/upgrade')
 @limiter.limit("10 per minute")
+@admission.admit(admission.NORMAL, limit=4, queue=8, wait=0.5, deadline=2.0)
 def upgrade():
     try:
         email = request.args.get('email')
         if not email or not utils.validate_email(email):
-            return jsonify({"error": "Valid email parameter is required"}), 400
+            return responses.constant(responses.INVALID_EMAIL)
             
-        user = utils.get_user(email)
+        user = utils.get_user(email, utils.UPGRADE_FIELDS)
         
         if not user:
-            return jsonify({"error": "User not found"}), 404
+            return responses.constant(responses.USER_NOT_FOUND)
         
-        payment_options = utils.get_payment_options(user['country'])
-        return jsonify(payment_options), 200
+        options = payments.get_options(user.get('country'))
+        # If-None-Match compares weakly: a CDN that compresses the body
+        # hands clients back W/"..." for our strong tag
+        if request.if_none_match.contains_weak(options.etag):
+            response = app.response_class(status=304, mimetype='application/json')
+        else:
+            response = app.response_class(options.body, status=200, mimetype='application/json')
+        response.headers['ETag'] = f'"{options.etag}"'
+        response.headers['Cache-Control'] = payments.CACHE_CONTROL
+        return response
     except Exception as e:
-        app.logger.error(f"Server error: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        return server_error(e)
 
 @app.route('/api/health')
+@admission.admit(admission.HIGH, limit=2, queue=2, wait=0.2, deadline=2.0)
 def health_check():
+    # ?deep=1 adds a ping; otherwise the report is built from the driver's
+    # own heartbeats and cached briefly
+    deep = request.args.get('deep') in ('1', 'true')
+    try:
+        report = health.status(deep=deep)
+    except Exception as e:
+        app.logger.error("Health check failed: %s", e)
+        report = {"status": health.UNHEALTHY, "error": str(e), "timestamp": datetime.utcnow().isoformat()}
+    return responses.json_response(report, health.http_status(report), headers={'Cache-Control': 'no-store'})
+
+def internal_auth_error(required: bool = False):
+    """401 response unless the request carries METRICS_TOKEN, when one is set.
+
+    With required, the endpoint is disabled (404) while no token is set.
+    """
+    token = os.getenv('METRICS_TOKEN')
+    if not token:
+        return responses.json_response({"error": "Not found"}, 404) if required else None
+    if request.headers.get('Authorization') != f"Bearer {token}":
+        return responses.json_response({"error": "Unauthorized"}, 401)
+    return None
+
+@app.route('/api/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    error = internal_auth_error()
+    if error:
+        return error
+    return metrics.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+MAX_ANALYTICS_LIMIT = 100
+MAX_ANALYTICS_DAYS = 366
+
+@app.route('/api/analytics')
+@limiter.limit("30 per minute")
+@admission.admit(admission.LOW, limit=2, queue=2, wait=1.0, deadline=5.0, retry_after=10)
+def analytics_endpoint():
+    # User data: never served without a token
+    error = internal_auth_error(required=True)
+    if error:
+        return error
     try:
-        utils.test_db_connection()
-        return jsonify({
-            "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat()
-        }), 200
+        limit = request.args.get('limit', 10, type=int)
+        days = request.args.get('days', 30, type=int)
+        if not 1 <= limit <= MAX_ANALYTICS_LIMIT or not 1 <= days <= MAX_ANALYTICS_DAYS:
+            return responses.json_response({
+                "error": f"limit must be 1-{MAX_ANALYTICS_LIMIT} and days 1-{MAX_ANALYTICS_DAYS}"
+            }, 400)
+        country = request.args.get('country') or None
+
+        return responses.json_response({
+            "country": country,
+            "top_keywords": analytics.top_keywords(country, limit=limit),
+            "signups_per_day": analytics.signups_per_day(days, country=country)
+        })
     except Exception as e:
-        app.logger.error(f"Health check failed: {str(e)}")
-        return jsonify({
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.utcnow().isoformat()
-        }), 500
+        return server_error(e)
 
 # Error Handlers
 @app.errorhandler(Exception)
 def handle_exception(e):
-    app.logger.error(f"Unhandled exception: {str(e)}")
-    return jsonify({
+    if admission.deadline_exceeded(e):
+        return server_error(e)
+    app.logger.error("Unhandled exception: %s", e)
+    return responses.json_response({
         "error": "Internal server error",
         "message": str(e) if app.debug else "An unexpected error occurred"
-    }), 500
+    }, 500)
+
+@app.errorhandler(429)
+def rate_limited(e):
+    return responses.json_response({"error": "Rate limit exceeded", "limit": str(e.description)}, 429)
 
 @app.errorhandler(404)
 def not_found(e):
-    return jsonify({"error": "Resource not found"}), 404
+    return responses.constant(responses.NOT_FOUND)
 
 @app.errorhandler(405)
 def method_not_allowed(e):
-    return jsonify({"error": "Method not allowed"}), 405
+    return responses.constant(responses.METHOD_NOT_ALLOWED)
 
 # Security Headers
 @app.after_request
 def add_security_headers(response):
-    response.headers['Content-Security-Policy'] = "default-src 'self'"
-    response.headers['X-Content-Type-Options'] = 'nosniff'
-    response.headers['X-Frame-Options'] = 'DENY'
-    response.headers['X-XSS-Protection'] = '1; mode=block'
-    response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
+    responses.add_security_headers(response)
+    request_id = logging_config.request_id_var.get()
+    if request_id:
+        response.headers['X-Request-ID'] = request_id
     return response
 
 if __name__ == '__main__':
@@ -0,0 +1,315 @@
+"""Job matching: an inverted keyword index over job postings, ranked with BM25.
+
+Postings are loaded once per process from JOBS_DATA_DIR (JSON arrays or
+NDJSON files) and shared by every request. The index can be updated in
+place with add_posting/remove_posting.
+"""
+from bisect import bisect_left, insort
+from heapq import heappush, heapreplace
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+from cache import TTLCache, MISSING
+
+JOBS_DATA_DIR = os.getenv('JOBS_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs'))
+
+# Title words count this many times over description words
+TITLE_BOOST = 3
+
+# Keeps tokens such as c++, c#, node.js and .net intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9.+#]*[a-z0-9+#]")
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'our', 'the', 'to', 'we', 'will', 'with',
+    'you', 'your'
+))
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token for token in TOKEN_PATTERN.findall(text.lower())
+        if token not in STOPWORDS
+    ]
+
+
+def keyword_terms(keywords: Union[str, Iterable[str]]) -> List[str]:
+    """Normalize a user's job_keywords into distinct query terms.
+
+    Accepts the list stored by signup or the comma-separated string used
+    in users.json.
+    """
+    if isinstance(keywords, str):
+        keywords = keywords.split(',')
+    terms = []
+    for keyword in keywords:
+        if isinstance(keyword, str):
+            terms.extend(tokenize(keyword))
+    return list(dict.fromkeys(terms))
+
+
+def posting_id(posting: Dict[str, Any]) -> str:
+    if posting.get('id') is not None:
+        return str(posting['id'])
+    source = posting.get('url') or f"{posting.get('title', '')}|{posting.get('company', '')}"
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+def posting_tokens(posting: Dict[str, Any]) -> List[str]:
+    title = tokenize(posting.get('title') or '')
+    body = tokenize(' '.join(
+        str(posting.get(field) or '') for field in ('company', 'location', 'description')
+    ))
+    return title * TITLE_BOOST + body
+
+
+class JobIndex:
+    """Inverted index from term to {document: term frequency}.
+
+    A BM25 score is a term's idf times a length-normalized term frequency.
+    The normalization depends on the average document length, taken from
+    a snapshot that is only refreshed once the live average (or document
+    count) drifts by more than STATS_TOLERANCE. Between refreshes an
+    update touches only the terms of the posting added or removed: their
+    cached weight lists are patched in place and their versions bumped,
+    and cached results are checked against those versions instead of
+    being cleared. idf is computed per query from the current document
+    frequency.
+
+    A search walks each query term's weights in descending order and
+    stops once no unseen document can reach the top k (Fagin's threshold
+    algorithm), so usually only a few documents are scored.
+    """
+
+    # Relative drift in document count or average length before every
+    # cached weight is recomputed
+    STATS_TOLERANCE = 0.02
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._terms: Dict[int, tuple] = {}
+        self._ids: Dict[str, int] = {}
+        self._next_doc = 0
+        self._total_length = 0
+        # Corpus statistics the cached weights were computed with
+        self._stats_count = 0
+        self._stats_average = 0.0
+        self._epoch = 0
+        self._versions: Dict[str, int] = {}
+        # term -> ({doc: weight}, [(-weight, doc)] ascending), built on
+        # the term's first search
+        self._weights: Dict[str, tuple] = {}
+        # Users re-run the same keywords; entries carry the term versions
+        # they were computed from
+        self._results = TTLCache(maxsize=1024, ttl=300)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add_posting(self, posting: Dict[str, Any]) -> str:
+        """Index a posting, replacing any earlier posting with the same id."""
+        external_id = posting_id(posting)
+        tokens = posting_tokens(posting)
+        frequencies: Dict[str, int] = {}
+        for token in tokens:
+            frequencies[token] = frequencies.get(token, 0) + 1
+
+        with self._lock:
+            self._remove(external_id)
+            doc = self._next_doc
+            self._next_doc += 1
+            self._ids[external_id] = doc
+            self._documents[doc] = {
+                "id": external_id,
+                "title": posting.get('title'),
+                "company": posting.get('company'),
+                "location": posting.get('location'),
+                "country": posting.get('country'),
+                "url": posting.get('url')
+            }
+            self._lengths[doc] = len(tokens)
+            self._terms[doc] = tuple(frequencies)
+            self._total_length += len(tokens)
+            for token, count in frequencies.items():
+                self._postings.setdefault(token, {})[doc] = count
+                self._versions[token] = self._versions.get(token, 0) + 1
+                cached = self._weights.get(token)
+                if cached is not None:
+                    weight = self._normalized(count, len(tokens))
+                    cached[0][doc] = weight
+                    insort(cached[1], (-weight, doc))
+            self._refresh_stats()
+        return external_id
+
+    def add_postings(self, postings: Iterable[Dict[str, Any]]) -> int:
+        count = 0
+        for posting in postings:
+            self.add_posting(posting)
+            count += 1
+        return count
+
+    def remove_posting(self, external_id: str) -> bool:
+        with self._lock:
+            removed = self._remove(external_id)
+            if removed:
+                self._refresh_stats()
+            return removed
+
+    def _remove(self, external_id: str) -> bool:
+        doc = self._ids.pop(external_id, None)
+        if doc is None:
+            return False
+        self._documents.pop(doc)
+        self._total_length -= self._lengths.pop(doc)
+        for token in self._terms.pop(doc):
+            docs = self._postings[token]
+            del docs[doc]
+            if not docs:
+                del self._postings[token]
+            self._versions[token] = self._versions.get(token, 0) + 1
+            cached = self._weights.get(token)
+            if cached is not None:
+                weight = cached[0].pop(doc)
+                ranked = cached[1]
+                del ranked[bisect_left(ranked, (-weight, doc))]
+        return True
+
+    def _refresh_stats(self) -> None:
+        count = len(self._documents)
+        average = self._total_length / count if count else 0.0
+        tolerance = self.STATS_TOLERANCE
+        if (abs(count - self._stats_count) <= tolerance * self._stats_count
+                and abs(average - self._stats_average) <= tolerance * self._stats_average):
+            return
+        self._stats_count = count
+        self._stats_average = average
+        # Every weight and result depends on the statistics
+        self._epoch += 1
+        self._weights.clear()
+
+    def _normalized(self, tf: int, length: int) -> float:
+        k1 = self.k1
+        return tf * (k1 + 1) / (tf + k1 * (1 - self.b + self.b * length / (self._stats_average or 1.0)))
+
+    def _version(self, terms: Iterable[str]) -> tuple:
+        versions = self._versions
+        return (self._epoch,) + tuple(versions.get(term, 0) for term in terms)
+
+    def _term_weights(self, term: str) -> tuple:
+        """(idf, weights by document, [(-weight, document)] ascending) for term."""
+        docs = self._postings.get(term)
+        if not docs:
+            return 0.0, {}, []
+        cached = self._weights.get(term)
+        if cached is None:
+            lengths = self._lengths
+            normalized = self._normalized
+            weights = {doc: normalized(tf, lengths[doc]) for doc, tf in docs.items()}
+            cached = self._weights[term] = (weights, sorted(zip([-w for w in weights.values()], weights)))
+        total = max(self._stats_count, len(docs))
+        idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+        return (idf,) + cached
+
+    def _top(self, terms: List[str], k: int) -> List[tuple]:
+        lists = [entry for entry in (self._term_weights(term) for term in terms) if entry[2]]
+        if not lists:
+            return []
+        if len(lists) == 1:
+            idf, _, ranked = lists[0]
+            return [(-weight * idf, doc) for weight, doc in ranked[:k]]
+
+        top: List[tuple] = []
+        seen = set()
+        longest = max(len(ranked) for _, _, ranked in lists)
+        for depth in range(longest):
+            threshold = 0.0
+            for idf, _, ranked in lists:
+                if depth >= len(ranked):
+                    continue
+                weight, doc = ranked[depth]
+                threshold -= weight * idf
+                if doc in seen:
+                    continue
+                seen.add(doc)
+                score = sum(term_idf * weights.get(doc, 0.0) for term_idf, weights, _ in lists)
+                if len(top) < k:
+                    heappush(top, (score, -doc))
+                elif score > top[0][0]:
+                    heapreplace(top, (score, -doc))
+            # No document further down can score more than threshold
+            if len(top) == k and top[0][0] >= threshold:
+                break
+        return [(score, -doc) for score, doc in sorted(top, reverse=True)]
+
+    def search(self, keywords: Union[str, Iterable[str]], k: int = 10) -> List[Dict[str, Any]]:
+        """Return the top k postings for the given keywords, best first."""
+        terms = keyword_terms(keywords)
+        if not terms or k <= 0:
+            return []
+
+        terms = sorted(terms)
+        key = (tuple(terms), k)
+        cached = self._results.get(key)
+        if cached is not MISSING and cached[0] == self._version(terms):
+            return [dict(match) for match in cached[1]]
+
+        with self._lock:
+            version = self._version(terms)
+            matches = [
+                dict(self._documents[doc], score=round(score, 4))
+                for score, doc in self._top(terms, k)
+            ]
+            self._results.set(key, (version, matches))
+        return [dict(match) for match in matches]
+
+
+def iter_postings(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield postings from a JSON array or NDJSON file, or a directory of them."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if name.endswith(('.json', '.jsonl', '.ndjson')):
+                yield from iter_postings(os.path.join(path, name))
+        return
+
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            yield from (posting for posting in data if isinstance(posting, dict))
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                posting = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(posting, dict):
+                yield posting
+
+
+_index: Optional[JobIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> JobIndex:
+    """Return the process-wide index, loading JOBS_DATA_DIR on first use."""
+    global _index
+    if _index is not None:
+        return _index
+    with _index_lock:
+        if _index is None:
+            index = JobIndex()
+            if os.path.exists(JOBS_DATA_DIR):
+                index.add_postings(iter_postings(JOBS_DATA_DIR))
+            _index = index
+        return _index
@@ -0,0 +1,236 @@
+"""In-process metrics with a Prometheus text exposition.
+
+Request latency comes from Flask hooks (see instrument_app), Mongo command
+durations and pool wait times from pymongo event listeners registered on
+the shared client, and anything else from gauges registered at startup.
+"""
+from bisect import bisect_left
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Tuple, Union
+from pymongo import monitoring
+import database
+
+# Upper bounds in seconds; the +Inf bucket is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], Union[float, Dict[Labels, float]]]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], Union[float, Dict[Labels, float]]],
+              kind: str = 'gauge') -> None:
+        """Register a value read at scrape time; kind may also be counter."""
+        self.describe(name, kind, help_text)
+        self._gauges[name] = collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {labels: (list(h.counts), h.sum, h.count, h.buckets) for labels, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, 'counter')
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, 'histogram')
+            for labels, (counts, total, count, buckets) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for name, collect in sorted(self._gauges.items()):
+            try:
+                value = collect()
+            except Exception:
+                continue
+            self._header(lines, name, 'gauge')
+            if isinstance(value, dict):
+                for labels, item in sorted(value.items()):
+                    lines.append(f"{name}{_labels(labels)} {item:g}")
+            else:
+                lines.append(f"{name} {value:g}")
+
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        kind, help_text = self._help.get(name, (kind, name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(str(value))}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+registry.describe('http_request_duration_seconds', 'histogram', 'Request latency by route and method')
+registry.describe('http_requests_total', 'counter', 'Responses by route, method and status')
+registry.describe('rate_limit_rejections_total', 'counter', 'Requests rejected by the rate limiter')
+registry.describe('mongodb_command_duration_seconds', 'histogram', 'Mongo command duration by command')
+registry.describe('mongodb_command_failures_total', 'counter', 'Failed Mongo commands by command')
+registry.describe('mongodb_pool_wait_seconds', 'histogram', 'Time spent waiting to check out a pooled connection')
+registry.describe('mongodb_pool_checkout_failures_total', 'counter', 'Failed connection checkouts by reason')
+
+
+class CommandTimer(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        registry.observe(
+            'mongodb_command_duration_seconds',
+            event.duration_micros / 1e6,
+            (('command', event.command_name),)
+        )
+
+    def failed(self, event):
+        labels = (('command', event.command_name),)
+        registry.observe('mongodb_command_duration_seconds', event.duration_micros / 1e6, labels)
+        registry.inc('mongodb_command_failures_total', labels)
+
+
+class PoolTimer(monitoring.ConnectionPoolListener):
+    """Measures checkout wait and tracks connections in use.
+
+    Checkout happens on the calling thread, so the start time is kept in
+    a thread-local between the started and checked-out events.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        # A forked child starts with no connections of its own
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.open = 0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            registry.observe('mongodb_pool_wait_seconds', time.perf_counter() - started)
+            self._local.started = None
+        with self._lock:
+            self.in_use += 1
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        registry.inc('mongodb_pool_checkout_failures_total', (('reason', str(event.reason)),))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+
+command_timer = CommandTimer()
+pool_timer = PoolTimer()
+database.register_listener(command_timer)
+database.register_listener(pool_timer)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=pool_timer.reset)
+
+registry.gauge('mongodb_pool_connections_in_use', 'Pooled connections currently checked out', lambda: pool_timer.in_use)
+registry.gauge('mongodb_pool_connections_open', 'Pooled connections currently open', lambda: pool_timer.open)
+
+
+def instrument_app(app) -> None:
+    """Record per-route latency, response counts and limiter rejections."""
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            labels = (('route', route), ('method', request.method))
+            registry.observe('http_request_duration_seconds', time.perf_counter() - started, labels)
+            registry.inc('http_requests_total', labels + (('status', str(response.status_code)),))
+            if response.status_code == 429:
+                registry.inc('rate_limit_rejections_total', (('route', route),))
+        return response
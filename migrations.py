@@ -0,0 +1,68 @@
+"""One-off data migrations for the users collection.
+
+Run with: python migrations.py backfill-trial-expires
+"""
+import argparse
+from datetime import datetime
+from pymongo import UpdateOne
+import analytics
+import database
+import utils
+
+
+def backfill_trial_expires(batch_size: int = 1000) -> int:
+    """Store trial_expires as a BSON date on every user that lacks one.
+
+    Documents with no trial_expires, or with the ISO string form, are
+    rewritten from the same value get_trial_expiry would compute. Returns
+    the number of documents updated.
+    """
+    collection = database.get_users_collection()
+    cursor = collection.find(
+        {'trial_expires': {'$not': {'$type': 'date'}}},
+        {'signup_date': 1, 'trial_expires': 1},
+        batch_size=batch_size
+    )
+
+    updated = 0
+    requests = []
+    for user in cursor:
+        try:
+            trial_expires = utils.get_trial_expiry(user)
+        except (KeyError, TypeError, ValueError):
+            # No usable signup date; leave it for manual cleanup
+            continue
+        requests.append(UpdateOne(
+            {'_id': user['_id']},
+            {'$set': {'trial_expires': trial_expires}}
+        ))
+        if len(requests) >= batch_size:
+            updated += collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+
+    if requests:
+        updated += collection.bulk_write(requests, ordered=False).modified_count
+    return updated
+
+
+def rebuild_analytics(batch_size: int = 1000) -> int:
+    """Recompute the analytics counters from the users, e.g. after enabling them."""
+    return analytics.rebuild(batch_size=batch_size)
+
+
+MIGRATIONS = {
+    'backfill-trial-expires': backfill_trial_expires,
+    'rebuild-analytics': rebuild_analytics
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a users collection migration")
+    parser.add_argument('migration', choices=sorted(MIGRATIONS))
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    database.ensure_indexes()
+    started = datetime.utcnow()
+    count = MIGRATIONS[args.migration](batch_size=args.batch_size)
+    print(f"{args.migration}: updated {count} documents in {datetime.utcnow() - started}")
@@ -0,0 +1,74 @@
+"""Payment options catalog.
+
+Built once at import: every region's options are encoded to JSON bytes
+with a strong ETag, and countries are looked up by normalized name, so
+serving /api/upgrade is a dict lookup plus a byte copy.
+"""
+import copy
+import hashlib
+import json
+from typing import Any, Dict
+
+MOBILE_MONEY_COUNTRIES = frozenset((
+    'uganda', 'kenya', 'nigeria', 'ghana', 'tanzania', 'rwanda'
+))
+
+REGION_OPTIONS = {
+    'mobile_money': {
+        "method": "Mobile Money",
+        "options": [
+            {
+                "provider": "MTN Mobile Money",
+                "link": "https://payment.jobhunterpro.com/mtn-momo",
+                "description": "Pay with MTN Mobile Money"
+            },
+            {
+                "provider": "Airtel Money",
+                "link": "https://payment.jobhunterpro.com/airtel-money",
+                "description": "Pay with Airtel Money"
+            }
+        ]
+    },
+    'card': {
+        "method": "Credit Card",
+        "options": [
+            {
+                "provider": "Stripe",
+                "link": "https://payment.jobhunterpro.com/stripe",
+                "description": "Secure card payment via Stripe"
+            }
+        ]
+    }
+}
+
+# Options only change with a deploy; shared caches may keep them briefly
+# and revalidate with the ETag after that
+CACHE_CONTROL = 'public, max-age=300'
+
+
+class EncodedOptions:
+    def __init__(self, region: str, data: Dict[str, Any]):
+        self.region = region
+        self.data = data
+        self.body = json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+
+CATALOG = {region: EncodedOptions(region, data) for region, data in REGION_OPTIONS.items()}
+
+
+def normalize_country(country: Any) -> str:
+    return country.strip().casefold() if isinstance(country, str) else ''
+
+
+def region_for(country: Any) -> str:
+    return 'mobile_money' if normalize_country(country) in MOBILE_MONEY_COUNTRIES else 'card'
+
+
+def get_options(country: Any) -> EncodedOptions:
+    return CATALOG[region_for(country)]
+
+
+def get_payment_options(country: Any) -> Dict[str, Any]:
+    """Return a copy of the options as a dict, safe for the caller to modify."""
+    return copy.deepcopy(get_options(country).data)
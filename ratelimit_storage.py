@@ -0,0 +1,158 @@
+"""Rate-limit storage shared by every worker process on a host.
+
+Importing this module registers the sqlite:// scheme with the limits
+package, so the Flask limiter can be pointed at a file:
+
+    RATELIMIT_STORAGE_URI=sqlite:////tmp/jobhunter-ratelimit.db
+
+Counters live in one small SQLite table in WAL mode. Every check is a
+single short transaction, so limits hold exactly across processes with
+no counts lost on restart. Fixed windows and sliding window counters
+are supported.
+"""
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport, TimestampedSlidingWindow
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'jobhunter-ratelimit.db')
+DEFAULT_URI = f"sqlite:///{DEFAULT_PATH}"
+
+# How long a writer waits for another process's transaction, in ms
+BUSY_TIMEOUT_MS = 2000
+# Share of writes that also purge expired counters
+PURGE_PROBABILITY = 0.001
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+'''
+
+# Adds to a live counter, or starts a new window if the old one expired
+INCR = '''
+INSERT INTO counters (key, count, expires_at) VALUES (?1, ?2, ?3)
+ON CONFLICT (key) DO UPDATE SET
+    count = CASE WHEN expires_at <= ?4 THEN excluded.count ELSE count + excluded.count END,
+    expires_at = CASE WHEN expires_at <= ?4 THEN excluded.expires_at ELSE expires_at END
+RETURNING count
+'''
+GET = 'SELECT count, expires_at FROM counters WHERE key = ? AND expires_at > ?'
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """limits storage backed by a SQLite file in WAL mode."""
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri: Optional[str] = None, wrap_exceptions: bool = False, **options):
+        # sqlite:///relative/path or sqlite:////absolute/path
+        self.path = uri[len('sqlite:///'):] if uri and uri.startswith('sqlite:///') else DEFAULT_PATH
+        self._local = threading.local()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened on first use, one per thread, never inherited across fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # Counters may lose the last writes on power loss, never on a crash
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(SCHEMA)
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _maybe_purge(self, connection: sqlite3.Connection, now: float) -> None:
+        if random.random() < PURGE_PROBABILITY:
+            connection.execute('DELETE FROM counters WHERE expires_at <= ?', (now,))
+
+    # Fixed window
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        connection = self._connection()
+        count = connection.execute(INCR, (key, amount, now + expiry, now)).fetchone()[0]
+        self._maybe_purge(connection, now)
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connection().execute(GET, (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connection().execute(GET, (key, now)).fetchone()
+        return row[1] if row else now
+
+    def clear(self, key: str) -> None:
+        self._connection().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    def reset(self) -> Optional[int]:
+        return self._connection().execute('DELETE FROM counters').rowcount
+
+    def check(self) -> bool:
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    # Sliding window counter
+
+    def _window(self, connection: sqlite3.Connection, key: str, expiry: int,
+                now: float) -> Tuple[str, int, float, int, float]:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous = connection.execute(GET, (previous_key, now)).fetchone()
+        current = connection.execute(GET, (current_key, now)).fetchone()
+        previous_count = previous[0] if previous else 0
+        current_count = current[0] if current else 0
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return current_key, previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        connection = self._connection()
+        try:
+            # The read and the increment share one write transaction, so
+            # two processes can never both take the last slot
+            connection.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            current_key, previous_count, previous_ttl, current_count, _ = self._window(connection, key, expiry, now)
+            allowed = int(previous_count * previous_ttl / expiry + current_count) + amount <= limit
+            if allowed:
+                connection.execute(INCR, (current_key, amount, now + 2 * expiry, now)).fetchone()
+                self._maybe_purge(connection, now)
+            connection.execute('COMMIT')
+            return allowed
+        except BaseException:
+            # BEGIN itself may have failed, e.g. busy past the timeout
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        return self._window(self._connection(), key, expiry, time.time())[1:]
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        for window_key in self.sliding_window_keys(key, expiry, time.time()):
+            self.clear(window_key)
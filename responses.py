@@ -0,0 +1,133 @@
+"""JSON responses shared by the Flask app and the api/*.py handlers.
+
+Encoding uses orjson when it is installed and falls back to the stdlib.
+Bodies for the common errors and the header blocks are built once at
+import, and large bodies can be gzipped when the client accepts it.
+"""
+import gzip
+import json
+from typing import Any, Dict, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Bodies smaller than this are not worth compressing
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+SECURITY_HEADERS = (
+    ('Content-Security-Policy', "default-src 'self'"),
+    ('X-Content-Type-Options', 'nosniff'),
+    ('X-Frame-Options', 'DENY'),
+    ('X-XSS-Protection', '1; mode=block'),
+    ('Strict-Transport-Security', 'max-age=31536000; includeSubDomains')
+)
+
+
+def _stdlib_dumps(data: Any) -> bytes:
+    return json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+
+
+if orjson is not None:
+    def dumps(data: Any) -> bytes:
+        try:
+            return orjson.dumps(data, default=str)
+        except TypeError:
+            # e.g. non-string dict keys, which the stdlib coerces
+            return _stdlib_dumps(data)
+else:
+    dumps = _stdlib_dumps
+
+
+# Pre-encoded (status, body) pairs for the errors every route returns
+INVALID_EMAIL = (400, dumps({"error": "Valid email parameter is required"}))
+USER_NOT_FOUND = (404, dumps({"error": "User not found"}))
+NOT_FOUND = (404, dumps({"error": "Resource not found"}))
+METHOD_NOT_ALLOWED = (405, dumps({"error": "Method not allowed"}))
+INTERNAL_ERROR = (500, dumps({"error": "Internal server error"}))
+
+Constant = Tuple[int, bytes]
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    return bool(accept_encoding) and 'gzip' in accept_encoding.lower()
+
+
+def encode(data: Union[bytes, Any], accept_encoding: Optional[str] = None,
+           compress: bool = False) -> Tuple[bytes, bool]:
+    """Return (body, gzipped) for data, which may already be bytes."""
+    body = data if isinstance(data, bytes) else dumps(data)
+    if compress and len(body) >= GZIP_MIN_BYTES and accepts_gzip(accept_encoding):
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), True
+    return body, False
+
+
+# Flask
+
+def json_response(data: Union[bytes, Any], status: int = 200, compress: bool = False,
+                  headers: Optional[Dict[str, str]] = None):
+    """Build a Flask response; compress=True gzips large bodies if accepted."""
+    from flask import Response, request
+
+    body, gzipped = encode(data, request.headers.get('Accept-Encoding') if compress else None, compress)
+    response = Response(body, status=status, mimetype='application/json')
+    if compress:
+        response.headers['Vary'] = 'Accept-Encoding'
+    if gzipped:
+        response.headers['Content-Encoding'] = 'gzip'
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def constant(error: Constant):
+    status, body = error
+    return json_response(body, status)
+
+
+def add_security_headers(response):
+    response.headers.extend(SECURITY_HEADERS)
+    return response
+
+
+# BaseHTTPRequestHandler
+
+_header_blocks: Dict[str, bytes] = {}
+
+
+def _header_block(methods: str) -> bytes:
+    block = _header_blocks.get(methods)
+    if block is None:
+        block = _header_blocks[methods] = (
+            'Content-Type: application/json\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            f'Access-Control-Allow-Methods: {methods}\r\n'
+            'Access-Control-Allow-Headers: Content-Type\r\n'
+        ).encode('latin-1')
+    return block
+
+
+def send_json(handler, status: int, data: Union[bytes, Any], methods: str = 'GET, OPTIONS',
+              compress: bool = False) -> None:
+    """Write a complete JSON response from a BaseHTTPRequestHandler.
+
+    The status line, the cached header block and the body go out in one
+    write.
+    """
+    body, gzipped = encode(data, handler.headers.get('Accept-Encoding') if compress else None, compress)
+    handler.log_request(status)
+    reason = handler.responses.get(status, ('',))[0]
+    status_line = f'{handler.protocol_version} {status} {reason}\r\n'.encode('latin-1')
+    extra = b'Content-Encoding: gzip\r\nVary: Accept-Encoding\r\n' if gzipped else b''
+    handler.wfile.write(
+        status_line + _header_block(methods) + extra
+        + b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n'
+        + body
+    )
+
+
+def send_constant(handler, error: Constant, methods: str = 'GET, OPTIONS') -> None:
+    status, body = error
+    send_json(handler, status, body, methods)
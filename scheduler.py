@@ -0,0 +1,254 @@
+"""Background execution of bot runs.
+
+/api/run enqueues a run and returns its id straight away; a bounded
+worker pool does the work and the result is polled by id. Each user has
+a cap on concurrently executing runs, and an identical run that is still
+pending is reused instead of queued again.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future
+from datetime import datetime
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+import database
+import matching
+
+logger = logging.getLogger(__name__)
+
+# "thread" shares the process-wide job index; "process" uses every core at
+# the cost of one index per worker process
+RUN_WORKER_MODE = os.getenv('RUN_WORKER_MODE', 'thread')
+RUN_WORKERS = int(os.getenv('RUN_WORKERS', str(os.cpu_count() or 2)))
+RUN_PER_USER_LIMIT = int(os.getenv('RUN_PER_USER_LIMIT', '1'))
+RUN_MAX_PENDING = int(os.getenv('RUN_MAX_PENDING', '1000'))
+# Finished runs kept in memory for polling
+RUN_RETENTION = int(os.getenv('RUN_RETENTION', '10000'))
+
+
+class SchedulerFull(Exception):
+    pass
+
+
+def execute_match(keywords: Any, k: int) -> Dict[str, Any]:
+    """Worker entry point for a matching run; must stay picklable."""
+    return {"matches": matching.get_index().search(keywords, k=k)}
+
+
+class Run:
+    def __init__(self, email: str, key: Hashable, func: Callable, args: tuple):
+        self.id = uuid.uuid4().hex
+        self.email = email
+        self.key = key
+        self.func = func
+        self.args = args
+        self.status = 'queued'
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "run_id": self.id,
+            "email": self.email,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == 'succeeded':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+
+class RunScheduler:
+    def __init__(self, executor: Executor, per_user_limit: int = RUN_PER_USER_LIMIT,
+                 max_pending: int = RUN_MAX_PENDING, retention: int = RUN_RETENTION):
+        self._executor = executor
+        self.per_user_limit = per_user_limit
+        self.max_pending = max_pending
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._runs: "OrderedDict[str, Run]" = OrderedDict()
+        self._pending: Dict[Hashable, Run] = {}
+        self._executing: Dict[str, int] = {}
+        self._waiting: Dict[str, Deque[Run]] = {}
+
+    def submit(self, email: str, key: Hashable, func: Callable, *args: Any) -> Run:
+        """Queue func(*args) for email, or return the identical pending run.
+
+        Raises SchedulerFull when max_pending runs are already unfinished.
+        """
+        with self._lock:
+            existing = self._pending.get(key)
+            if existing is not None:
+                return existing
+            if len(self._pending) >= self.max_pending:
+                raise SchedulerFull("Too many pending runs")
+
+            run = Run(email, key, func, args)
+            self._pending[key] = run
+            self._remember(run)
+            start = self._executing.get(email, 0) < self.per_user_limit
+            if start:
+                self._claim(run)
+            else:
+                self._waiting.setdefault(email, deque()).append(run)
+
+        # Stored before starting so the final state is always written last
+        _store(run)
+        if start:
+            self._start(run)
+        return run
+
+    def get(self, run_id: str) -> Optional[Run]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "executing": sum(self._executing.values()),
+                "waiting": sum(len(runs) for runs in self._waiting.values()),
+                "retained": len(self._runs)
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _remember(self, run: Run) -> None:
+        self._runs[run.id] = run
+        # Drop the oldest finished runs; unfinished ones are bounded by
+        # max_pending instead
+        while len(self._runs) > self.retention + len(self._pending):
+            oldest_id, oldest = next(iter(self._runs.items()))
+            if not oldest.finished:
+                break
+            del self._runs[oldest_id]
+
+    def _claim(self, run: Run) -> None:
+        # Called with the lock held
+        self._executing[run.email] = self._executing.get(run.email, 0) + 1
+        run.status = 'running'
+        run.started_at = datetime.utcnow()
+
+    def _start(self, run: Run) -> None:
+        # Called without the lock: a future that is already done runs its
+        # callback, and so _finish, right here
+        future = self._executor.submit(run.func, *run.args)
+        future.add_done_callback(lambda f: self._finish(run, f))
+
+    def _finish(self, run: Run, future: Future) -> None:
+        try:
+            run.result = future.result()
+            run.status = 'succeeded'
+        except Exception as e:
+            run.error = str(e)
+            run.status = 'failed'
+        run.finished_at = datetime.utcnow()
+        # Arguments can be large; the run only needs its outcome now
+        run.func = None
+        run.args = ()
+
+        next_run = None
+        with self._lock:
+            if self._pending.get(run.key) is run:
+                del self._pending[run.key]
+            remaining = self._executing.get(run.email, 1) - 1
+            if remaining:
+                self._executing[run.email] = remaining
+            else:
+                self._executing.pop(run.email, None)
+
+            waiting = self._waiting.get(run.email)
+            if waiting:
+                next_run = waiting.popleft()
+                if not waiting:
+                    del self._waiting[run.email]
+                self._claim(next_run)
+
+        _store(run)
+        if next_run is not None:
+            _store(next_run)
+            self._start(next_run)
+
+
+def serialize_run(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in data.items()
+    }
+
+
+def _store(run: Run) -> None:
+    """Mirror a run into Mongo so a poll served by another worker finds it."""
+    try:
+        data = run.to_dict()
+        data.pop('run_id')
+        database.get_runs_collection().update_one(
+            {'run_id': run.id},
+            {'$set': data},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("Failed to store run %s: %s", run.id, e)
+
+
+def load_run(run_id: str) -> Optional[Dict[str, Any]]:
+    """Return a run by id, from this worker or from the shared store."""
+    run = get_scheduler().get(run_id)
+    if run is not None:
+        return serialize_run(run.to_dict())
+    try:
+        data = database.get_runs_collection().find_one({'run_id': run_id}, {'_id': 0})
+    except Exception as e:
+        raise Exception(f"Failed to load run: {str(e)}")
+    return serialize_run(data) if data else None
+
+
+def submit_match(email: str, keywords: Any, k: int) -> Run:
+    terms = tuple(matching.keyword_terms(keywords or []))
+    return get_scheduler().submit(email, ('match', email, terms, k), execute_match, list(terms), k)
+
+
+_scheduler: Optional[RunScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RunScheduler:
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            # Imported here: the process pool pulls in multiprocessing
+            if RUN_WORKER_MODE == 'process':
+                from concurrent.futures import ProcessPoolExecutor
+                executor = ProcessPoolExecutor(max_workers=RUN_WORKERS)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                executor = ThreadPoolExecutor(max_workers=RUN_WORKERS, thread_name_prefix='run')
+            _scheduler = RunScheduler(executor)
+        return _scheduler
+
+
+def _reset_after_fork() -> None:
+    # Worker threads do not survive fork; the child builds its own pool
+    global _scheduler, _scheduler_lock
+    _scheduler = None
+    _scheduler_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
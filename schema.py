@@ -0,0 +1,159 @@
+"""Declarative request validation shared by the Flask app and the handlers.
+
+A Schema maps field names to rules. Each rule normalizes one value or
+raises Invalid. Building a Schema compiles its rules into a single
+validate(data) function, called once per request.
+
+Schema.read enforces the size limit before the body is read and parses
+the body once. Oversized or malformed payloads are rejected before any
+database work starts. Validated data contains only the schema's fields,
+already normalized:
+- emails are stripped
+- keywords are trimmed, whitespace-collapsed and deduplicated
+- countries are stripped
+"""
+import json
+import os
+from typing import Any, BinaryIO, Callable, Dict, Iterable, List, Optional, Union
+import utils
+
+# Largest single-record body accepted, in bytes
+MAX_BODY_BYTES = int(os.getenv('MAX_BODY_BYTES', '16384'))
+MAX_KEYWORDS = int(os.getenv('MAX_KEYWORDS', '20'))
+# Matches what analytics keeps of a keyword phrase
+MAX_KEYWORD_LENGTH = int(os.getenv('MAX_KEYWORD_LENGTH', '100'))
+# RFC 5321 path limit
+MAX_EMAIL_LENGTH = 254
+MAX_COUNTRY_LENGTH = 64
+
+Rule = Callable[[Any], Any]
+
+
+class Invalid(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+# Rules
+
+def email_field(max_length: int = MAX_EMAIL_LENGTH) -> Rule:
+    pattern = utils.EMAIL_PATTERN
+
+    def check(value: Any) -> str:
+        # Length first, so the pattern never runs on a huge string
+        if not isinstance(value, str) or len(value) > max_length:
+            raise Invalid("Invalid email format")
+        value = value.strip()
+        if not pattern.match(value):
+            raise Invalid("Invalid email format")
+        return value
+    return check
+
+
+def keywords_field(max_items: int = MAX_KEYWORDS, max_length: int = MAX_KEYWORD_LENGTH) -> Rule:
+    def check(value: Any) -> List[str]:
+        if not isinstance(value, list):
+            raise Invalid("Job keywords must be a list")
+        if len(value) > max_items:
+            raise Invalid(f"At most {max_items} job keywords")
+        keywords = []
+        seen = set()
+        for item in value:
+            if not isinstance(item, str):
+                raise Invalid("Invalid job keywords format")
+            keyword = ' '.join(item.split())
+            if not keyword:
+                raise Invalid("Invalid job keywords format")
+            if len(keyword) > max_length:
+                raise Invalid(f"Job keywords must be at most {max_length} characters")
+            # "Python" and "python " are the same search
+            folded = keyword.casefold()
+            if folded not in seen:
+                seen.add(folded)
+                keywords.append(keyword)
+        return keywords
+    return check
+
+
+def country_field(max_length: int = MAX_COUNTRY_LENGTH) -> Rule:
+    def check(value: Any) -> str:
+        if not isinstance(value, str) or len(value) > max_length or not utils.validate_country(value):
+            raise Invalid("Invalid country")
+        return value.strip()
+    return check
+
+
+def parse_content_length(value: Union[int, str, None]) -> Optional[int]:
+    """Content-Length as a byte count, or None when absent.
+
+    A negative length would make read() consume the stream to EOF, past
+    the size limit, so it is rejected like a non-numeric one.
+    """
+    if value is None:
+        return None
+    try:
+        length = int(value)
+    except ValueError:
+        raise Invalid("Invalid Content-Length")
+    if length < 0:
+        raise Invalid("Invalid Content-Length")
+    return length
+
+
+class Schema:
+    def __init__(self, rules: Dict[str, Rule], required: Optional[Iterable[str]] = None,
+                 max_body_bytes: int = MAX_BODY_BYTES):
+        self.rules = dict(rules)
+        self.required = tuple(required if required is not None else self.rules)
+        self.max_body_bytes = max_body_bytes
+        self.validate = self._compile()
+
+    def _compile(self) -> Callable[[Any], Dict[str, Any]]:
+        rules = tuple(self.rules.items())
+        required = self.required
+
+        def validate(data: Any) -> Dict[str, Any]:
+            """Return the normalized fields of data or raise Invalid."""
+            if not data:
+                raise Invalid("No data provided")
+            if not isinstance(data, dict):
+                raise Invalid("Payload must be a JSON object")
+            missing = [field for field in required if field not in data]
+            if missing:
+                raise Invalid(f"Missing required fields: {', '.join(missing)}")
+            return {name: rule(data[name]) for name, rule in rules if name in data}
+        return validate
+
+    def parse(self, body: bytes) -> Dict[str, Any]:
+        if len(body) > self.max_body_bytes:
+            raise Invalid("Request body too large", 413)
+        if not body.strip():
+            raise Invalid("No data provided")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise Invalid("Invalid JSON body")
+        return self.validate(data)
+
+    def read(self, stream: BinaryIO, content_length: Union[int, str, None]) -> Dict[str, Any]:
+        """Read, parse and validate a body; a declared oversize is refused unread.
+
+        content_length may be the raw header value.
+        """
+        content_length = parse_content_length(content_length)
+        if content_length is not None and content_length > self.max_body_bytes:
+            raise Invalid("Request body too large", 413)
+        # Without a length, read one byte past the limit to detect overflow
+        return self.parse(stream.read(self.max_body_bytes + 1 if content_length is None else content_length))
+
+
+SIGNUP = Schema({
+    'email': email_field(),
+    'job_keywords': keywords_field(),
+    'country': country_field()
+})
+
+# For email query parameters
+check_email = email_field()
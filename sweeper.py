@@ -0,0 +1,339 @@
+"""Trial-expiry sweeper.
+
+Finds users whose trial has ended but who are still marked as trialing,
+flips them to subscription_status "expired" with bulk updates and
+appends an upgrade notice per user to a local NDJSON outbox for the
+mailer to pick up.
+
+Users are read in pages of --batch-size, each page a fresh range query
+on the (subscription_status, trial_expires, _id) index that resumes
+after the last user seen, so memory stays flat however many users have
+expired and no cursor is held open between pages. After every page the
+position is written to a checkpoint file; a sweep that crashes resumes
+from there with the same cutoff.
+
+Every flip is stamped with the sweep's id, and notices are written
+only for the users a page's conditional update actually flipped, so a
+trial renewed between the read and the update gets none. A resumed
+sweep first writes notices for users it flipped past its checkpoint
+before the crash, so a notice can repeat but is never lost. Each notice
+has a stable id for the consumer to deduplicate on.
+
+Run with: python sweeper.py [--loop SECONDS]
+Only trial_expires stored as a date is matched; run
+`python migrations.py backfill-trial-expires` first on older data.
+"""
+import argparse
+from datetime import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+import database
+import utils
+
+logger = logging.getLogger(__name__)
+
+SWEEP_BATCH_SIZE = int(os.getenv('SWEEP_BATCH_SIZE', '1000'))
+SWEEP_OUTBOX = os.getenv('SWEEP_OUTBOX', 'outbox/upgrade_notices.ndjson')
+SWEEP_CHECKPOINT = os.getenv('SWEEP_CHECKPOINT', 'outbox/sweep.checkpoint')
+# Seconds between in-process sweeps; 0 disables them
+SWEEP_INTERVAL = float(os.getenv('SWEEP_INTERVAL', '0'))
+
+TRIAL = 'trial'
+EXPIRED = 'expired'
+
+FIELDS = {'_id': 1, 'email': 1, 'country': 1, 'trial_expires': 1}
+
+
+def _write_atomic(path: str, data: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _ensure_dir(path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+class Checkpoint:
+    """Cutoff and position of an unfinished sweep."""
+
+    def __init__(self, cutoff: datetime, after: Optional[Dict[str, Any]] = None,
+                 flipped: int = 0, notices: int = 0, sweep_id: Optional[str] = None):
+        self.cutoff = cutoff
+        self.after = after
+        self.flipped = flipped
+        self.notices = notices
+        # Stamped on every user this sweep expires
+        self.sweep_id = sweep_id or uuid.uuid4().hex
+
+    @classmethod
+    def load(cls, path: str) -> Optional['Checkpoint']:
+        from bson import ObjectId
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        after = data.get('after')
+        if after:
+            user_id = after['_id']
+            after = {
+                'trial_expires': datetime.fromisoformat(after['trial_expires']),
+                '_id': ObjectId(user_id) if ObjectId.is_valid(user_id) else user_id
+            }
+        return cls(datetime.fromisoformat(data['cutoff']), after, data.get('flipped', 0), data.get('notices', 0),
+                   data.get('sweep_id'))
+
+    def save(self, path: str) -> None:
+        after = None
+        if self.after:
+            after = {'trial_expires': self.after['trial_expires'].isoformat(), '_id': str(self.after['_id'])}
+        _write_atomic(path, {
+            'cutoff': self.cutoff.isoformat(),
+            'after': after,
+            'flipped': self.flipped,
+            'notices': self.notices,
+            'sweep_id': self.sweep_id
+        })
+
+
+def _page_filter(checkpoint: Checkpoint, status: str = TRIAL) -> Dict[str, Any]:
+    query: Dict[str, Any] = {
+        'subscription_status': status,
+        'trial_expires': {'$lte': checkpoint.cutoff}
+    }
+    after = checkpoint.after
+    if after:
+        query['$or'] = [
+            {'trial_expires': {'$gt': after['trial_expires']}},
+            {'trial_expires': after['trial_expires'], '_id': {'$gt': after['_id']}}
+        ]
+    return query
+
+
+def notice_for(user: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    trial_expires = user['trial_expires']
+    return {
+        "id": f"trial_expired:{user['email']}:{trial_expires.isoformat()}",
+        "type": "trial_expired",
+        "email": user['email'],
+        "country": user.get('country'),
+        "trial_expired_at": trial_expires.isoformat(),
+        "payment_options": utils.get_payment_options(user.get('country')),
+        "created_at": now.isoformat()
+    }
+
+
+def _append_notices(outbox: str, notices: List[Dict[str, Any]]) -> None:
+    # One write per page, so concurrent readers never see half a page
+    if not notices:
+        return
+    data = ''.join(json.dumps(notice, default=str) + '\n' for notice in notices)
+    with open(outbox, 'a') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _find_page(collection, query: Dict[str, Any], limit: int = 0) -> List[Dict[str, Any]]:
+    return list(collection.find(query, FIELDS).sort([('trial_expires', 1), ('_id', 1)]).limit(limit))
+
+
+def _record_expired(checkpoint: Checkpoint, outbox: str, users: List[Dict[str, Any]], now: datetime) -> None:
+    _append_notices(outbox, [notice_for(user, now) for user in users])
+    checkpoint.notices += len(users)
+    for user in users:
+        utils.invalidate_user(user['email'])
+
+
+def _recover(collection, checkpoint: Checkpoint, outbox: str, checkpoint_path: str) -> None:
+    # Users this sweep flipped after its last checkpoint, before a crash,
+    # still need their notices
+    query = dict(_page_filter(checkpoint, EXPIRED), expired_by=checkpoint.sweep_id)
+    users = _find_page(collection, query)
+    if not users:
+        return
+    _record_expired(checkpoint, outbox, users, datetime.utcnow())
+    checkpoint.flipped += len(users)
+    last = users[-1]
+    checkpoint.after = {'trial_expires': last['trial_expires'], '_id': last['_id']}
+    checkpoint.save(checkpoint_path)
+
+
+def sweep(batch_size: int = SWEEP_BATCH_SIZE, outbox: str = SWEEP_OUTBOX,
+          checkpoint_path: str = SWEEP_CHECKPOINT) -> Dict[str, Any]:
+    """Expire every trial that ended before the sweep started.
+
+    Returns counts for the whole sweep, including work done before a
+    resume; pages counts this call only.
+    """
+    from pymongo import UpdateOne
+
+    _ensure_dir(outbox)
+    _ensure_dir(checkpoint_path)
+    checkpoint = Checkpoint.load(checkpoint_path)
+    resumed = checkpoint is not None
+    if checkpoint is None:
+        checkpoint = Checkpoint(datetime.utcnow())
+
+    collection = database.get_users_collection()
+    if resumed:
+        _recover(collection, checkpoint, outbox, checkpoint_path)
+    pages = 0
+    while True:
+        users = _find_page(collection, _page_filter(checkpoint), batch_size)
+        if not users:
+            break
+
+        # The status and expiry conditions keep a concurrent upgrade or a
+        # fresh signup's new trial from being expired
+        now = datetime.utcnow()
+        result = collection.bulk_write([
+            UpdateOne(
+                {'_id': user['_id'], 'subscription_status': TRIAL, 'trial_expires': user['trial_expires']},
+                {'$set': {'subscription_status': EXPIRED, 'trial_active': False, 'expired_at': now,
+                          'expired_by': checkpoint.sweep_id}}
+            )
+            for user in users
+        ], ordered=False)
+        checkpoint.flipped += result.modified_count
+        # Notices only for the users the updates matched
+        expired = _find_page(collection, {'_id': {'$in': [user['_id'] for user in users]},
+                                          'expired_by': checkpoint.sweep_id})
+        _record_expired(checkpoint, outbox, expired, now)
+
+        last = users[-1]
+        checkpoint.after = {'trial_expires': last['trial_expires'], '_id': last['_id']}
+        checkpoint.save(checkpoint_path)
+        pages += 1
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    stats = {
+        "cutoff": checkpoint.cutoff.isoformat(),
+        "flipped": checkpoint.flipped,
+        "notices": checkpoint.notices,
+        "pages": pages,
+        "resumed": resumed
+    }
+    logger.info("Trial sweep finished: %s", stats)
+    return stats
+
+
+class _HostLock:
+    """Non-blocking exclusive lock file, so one sweep runs per host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+
+    def release(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def sweep_once(**kwargs) -> Optional[Dict[str, Any]]:
+    """Sweep unless another process on this host already is; None if skipped."""
+    checkpoint_path = kwargs.get('checkpoint_path', SWEEP_CHECKPOINT)
+    _ensure_dir(checkpoint_path)
+    lock = _HostLock(f"{checkpoint_path}.lock")
+    if not lock.acquire():
+        return None
+    try:
+        return sweep(**kwargs)
+    finally:
+        lock.release()
+
+
+class Sweeper(threading.Thread):
+    """Runs sweep_once every interval seconds in the background."""
+
+    def __init__(self, interval: float = SWEEP_INTERVAL, **kwargs):
+        super().__init__(name='trial-sweeper', daemon=True)
+        self.interval = interval
+        self.kwargs = kwargs
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            try:
+                sweep_once(**self.kwargs)
+            except Exception as e:
+                # The checkpoint keeps the position for the next round
+                logger.warning("Trial sweep failed: %s", e)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+_sweeper: Optional[Sweeper] = None
+_sweeper_lock = threading.Lock()
+
+
+def start_in_process(interval: float = SWEEP_INTERVAL) -> Optional[Sweeper]:
+    """Start the background sweeper once per process if interval > 0."""
+    global _sweeper
+    if interval <= 0:
+        return None
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = Sweeper(interval)
+            _sweeper.start()
+        return _sweeper
+
+
+def _reset_after_fork() -> None:
+    # The thread does not survive fork; the child starts its own
+    global _sweeper, _sweeper_lock
+    _sweeper = None
+    _sweeper_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Expire ended trials and queue upgrade notices")
+    parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+    parser.add_argument('--outbox', default=SWEEP_OUTBOX)
+    parser.add_argument('--checkpoint', default=SWEEP_CHECKPOINT)
+    parser.add_argument('--loop', type=float, metavar='SECONDS', help="Keep sweeping at this interval")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    database.ensure_indexes()
+    options = dict(batch_size=args.batch_size, outbox=args.outbox, checkpoint_path=args.checkpoint)
+    while True:
+        started = time.monotonic()
+        stats = sweep_once(**options)
+        print(json.dumps(stats) if stats else "Another sweep is running; skipped")
+        if not args.loop:
+            break
+        time.sleep(max(0.0, args.loop - (time.monotonic() - started)))
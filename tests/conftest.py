@@ -0,0 +1,25 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Importing main starts file logging; keep it out of the working tree
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.mkdtemp(prefix='jobhunter-tests-'), 'app.log'))
+
+
+@pytest.fixture
+def mongo():
+    """An empty mongomock database behind the data layer."""
+    mongomock = pytest.importorskip('mongomock')
+    import database
+    import utils
+
+    database.use_client(mongomock.MongoClient())
+    database.DATABASE_NAME = 'jobhunter_test'
+    database.ensure_indexes()
+    utils.user_cache.clear()
+    yield database.get_database()
+    utils.user_cache.clear()
+    database.reset_client()
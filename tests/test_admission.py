@@ -0,0 +1,114 @@
+"""Admission control: per-route limits, priorities, wait queues and deadlines."""
+import threading
+import pytest
+from flask import Flask
+from pymongo.errors import ExecutionTimeout
+import admission
+
+
+def hold(controller, gate, count):
+    for _ in range(count):
+        controller.acquire(gate)
+
+
+def test_route_limit_and_queue():
+    controller = admission.AdmissionController(capacity=8)
+    gate = controller.gate('run', limit=1, queue=1, wait=5.0)
+    controller.acquire(gate)
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(controller.acquire(gate)))
+    waiter.start()
+    while not gate.waiting:
+        threading.Event().wait(0.001)
+    # One waiter already fills the queue
+    with pytest.raises(admission.Rejected) as rejected:
+        controller.acquire(gate)
+    assert rejected.value.reason == 'queue_full'
+
+    controller.release(gate)
+    waiter.join()
+    assert admitted == [None] and gate.in_flight == 1
+
+
+def test_wait_timeout():
+    controller = admission.AdmissionController(capacity=8)
+    gate = controller.gate('run', limit=1, queue=1, wait=0.01, retry_after=7)
+    controller.acquire(gate)
+
+    with pytest.raises(admission.Rejected) as rejected:
+        controller.acquire(gate)
+    assert (rejected.value.reason, rejected.value.retry_after) == ('wait_timeout', 7)
+    assert gate.waiting == 0
+
+
+def test_low_priority_is_shed_before_high():
+    controller = admission.AdmissionController(capacity=4)
+    low = controller.gate('batch', admission.LOW)
+    high = controller.gate('status', admission.HIGH)
+    # LOW may fill half of the capacity
+    hold(controller, low, 2)
+    with pytest.raises(admission.Rejected):
+        controller.acquire(low)
+
+    hold(controller, high, 2)
+    with pytest.raises(admission.Rejected):
+        controller.acquire(high)
+    assert controller.stats() == {'batch': {'in_flight': 2, 'waiting': 0}, 'status': {'in_flight': 2, 'waiting': 0}}
+
+
+def test_deadline_exceeded_follows_the_context():
+    try:
+        try:
+            raise ExecutionTimeout("operation exceeded time limit")
+        except ExecutionTimeout:
+            raise Exception("Database error")
+    except Exception as e:
+        error = e
+    assert admission.deadline_exceeded(error)
+    assert not admission.deadline_exceeded(Exception("Database error"))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    monkeypatch.setattr(admission, 'controller', admission.AdmissionController(capacity=4))
+    monkeypatch.setattr(admission, 'ADMISSION_ENABLED', True)
+    app = Flask(__name__)
+    release = threading.Event()
+
+    @app.route('/slow')
+    @admission.admit(admission.NORMAL, limit=1, retry_after=3)
+    def slow():
+        release.wait(5)
+        return 'done'
+
+    @app.route('/deadline')
+    @admission.admit(deadline=0.25)
+    def deadline():
+        # What every Mongo operation in the request would be capped at
+        from pymongo import _csot
+        return str(_csot.get_timeout())
+
+    app.release = release
+    return app
+
+
+def test_decorator_sheds_with_retry_after(app):
+    first = []
+    thread = threading.Thread(target=lambda: first.append(app.test_client().get('/slow')))
+    thread.start()
+    while not admission.controller.in_flight:
+        threading.Event().wait(0.001)
+
+    response = app.test_client().get('/slow')
+    app.release.set()
+    thread.join()
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert first[0].status_code == 200
+    assert admission.controller.in_flight == 0
+
+
+def test_decorator_applies_the_mongo_deadline(app):
+    assert 0 < float(app.test_client().get('/deadline').data) <= 0.25
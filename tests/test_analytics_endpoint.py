@@ -0,0 +1,26 @@
+"""/api/analytics is only served with METRICS_TOKEN configured and presented."""
+import json
+import pytest
+
+
+@pytest.fixture
+def client(mongo, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.limiter, 'enabled', False)
+    return main.app.test_client()
+
+
+def test_disabled_without_a_token(client, monkeypatch):
+    monkeypatch.delenv('METRICS_TOKEN', raising=False)
+    assert client.get('/api/analytics').status_code == 404
+
+
+def test_requires_the_token(client, monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', 'secret')
+    assert client.get('/api/analytics').status_code == 401
+    assert client.get('/api/analytics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+
+    response = client.get('/api/analytics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert json.loads(response.data)['top_keywords'] == []
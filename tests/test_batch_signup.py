@@ -0,0 +1,53 @@
+"""/api/signup/batch: per-record validation, duplicates and refusals."""
+import json
+import pytest
+
+
+@pytest.fixture
+def client(mongo, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.limiter, 'enabled', False)
+    return main.app.test_client()
+
+
+def record(email, country='Kenya'):
+    return {'email': email, 'job_keywords': ['python'], 'country': country}
+
+
+def test_batch_reports_each_record(client, mongo):
+    response = client.post('/api/signup/batch', json=[
+        record('a@example.com'),
+        record('not-an-email'),
+        record('a@example.com', 'Uganda'),
+        record('b@example.com')
+    ])
+    body = json.loads(response.data)
+
+    assert response.status_code == 200
+    assert [result['status'] for result in body['results']] == ['duplicate', 'invalid', 'created', 'created']
+    assert body['summary'] == {'duplicate': 1, 'invalid': 1, 'created': 2}
+    assert mongo.users.find_one({'email': 'a@example.com'})['country'] == 'Uganda'
+
+
+def test_ndjson_batch(client):
+    lines = '\n'.join([json.dumps(record('a@example.com')), '{bad json', ''])
+    response = client.post('/api/signup/batch', data=lines, content_type='application/x-ndjson')
+
+    assert [result['status'] for result in json.loads(response.data)['results']] == ['created', 'invalid']
+
+
+@pytest.mark.parametrize('data, content_type, status', [
+    ('{"email": "a@example.com"}', 'application/json', 400),
+    ('[]', 'application/json', 400),
+])
+def test_refused_batches(client, data, content_type, status):
+    assert client.post('/api/signup/batch', data=data, content_type=content_type).status_code == status
+
+
+def test_oversized_batch_is_refused(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, 'MAX_BATCH_SIGNUPS', 2)
+    response = client.post('/api/signup/batch', json=[record(f"{i}@example.com") for i in range(3)])
+    assert response.status_code == 413
@@ -0,0 +1,25 @@
+"""Cold-start budget for the serverless entry points and the Flask app."""
+import pytest
+from benchmarks import importtime
+
+# (module, budget in ms, packages it must not import)
+ENTRY_POINTS = [
+    ('api.health', 150, ('pymongo', 'dns')),
+    ('api.signup', 150, ('pymongo', 'dns')),
+    ('api.status', 150, ('pymongo', 'dns')),
+    ('api.index', 400, ('pymongo', 'dns')),
+    ('main', 700, ())
+]
+
+REPEAT = 3
+
+
+@pytest.mark.parametrize('module, budget_ms, forbidden', ENTRY_POINTS)
+def test_import_budget(module, budget_ms, forbidden):
+    # The fastest of a few runs, so one slow start on a busy runner does not fail
+    runs = [importtime.profile(module) for _ in range(REPEAT)]
+    timings, loaded = min(runs, key=lambda run: sum(self_us for _, self_us, _ in run[0]))
+
+    total_ms = sum(self_us for _, self_us, _ in timings) / 1000
+    assert total_ms <= budget_ms, f"{module} imports in {total_ms:.1f} ms"
+    assert not [package for package in forbidden if package in loaded]
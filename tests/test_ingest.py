@@ -0,0 +1,49 @@
+"""Feed ingestion: streaming RSS and Atom parsing."""
+import xml.etree.ElementTree as ET
+import pytest
+import ingest
+
+ITEMS = 20000
+
+
+def write_feed(path, items, atom=False):
+    with open(path, 'w', encoding='utf-8') as f:
+        if atom:
+            f.write('<feed xmlns="http://www.w3.org/2005/Atom"><title>Jobs</title>')
+            item = '<entry><title>Job {0}</title><link href="https://example.com/{0}"/></entry>'
+        else:
+            f.write('<rss version="2.0"><channel><title>Jobs</title>')
+            item = '<item><title>Job {0}</title><link>https://example.com/{0}</link></item>'
+        for i in range(items):
+            f.write(item.format(i))
+        f.write('</feed>' if atom else '</channel></rss>')
+
+
+@pytest.fixture
+def containers(monkeypatch):
+    """The two outermost elements of the feed (<rss><channel> or <feed>),
+    to count the children read_rss leaves on them."""
+    outer = []
+    iterparse = ET.iterparse
+
+    def recording_iterparse(*args, **kwargs):
+        for event, elem in iterparse(*args, **kwargs):
+            if event == 'start' and len(outer) < 2:
+                outer.append(elem)
+            yield event, elem
+    monkeypatch.setattr(ingest.ET, 'iterparse', recording_iterparse)
+    return outer
+
+
+@pytest.mark.parametrize('atom', [False, True])
+def test_items_are_not_retained(tmp_path, containers, atom):
+    path = str(tmp_path / 'feed.xml')
+    write_feed(path, ITEMS, atom)
+
+    records = ingest.read_rss(path)
+    first = next(records)
+    count = 1 + sum(1 for _ in records)
+
+    assert count == ITEMS
+    assert first == {'title': 'Job 0', 'link': 'https://example.com/0'}
+    assert sum(len(elem) for elem in containers) < 10
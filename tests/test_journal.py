@@ -0,0 +1,131 @@
+"""Write-behind signup journal: group commit, crash replay and failed commits."""
+import os
+import threading
+import time
+import pytest
+import database
+import journal
+import utils
+
+
+def make_user(i):
+    return utils.build_user({'email': f"user{i}@example.com", 'job_keywords': ['python'], 'country': 'Kenya'})
+
+
+def stored_emails():
+    return sorted(doc['email'] for doc in database.get_users_collection().find({}, {'email': 1}))
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'journal')
+
+
+def test_concurrent_appends_share_fsyncs(mongo, directory, monkeypatch):
+    fsyncs = []
+
+    def slow_fsync(fd):
+        # A disk slow enough for appenders to pile up behind each fsync
+        fsyncs.append(fd)
+        time.sleep(0.002)
+    monkeypatch.setattr(journal.os, 'fsync', slow_fsync)
+
+    signups = journal.SignupJournal(directory, flush_interval=0.01)
+    threads = [
+        threading.Thread(target=lambda start=start: [signups.append(make_user(i)) for i in range(start, start + 25)])
+        for start in range(0, 200, 25)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    signups.close()
+
+    assert len(stored_emails()) == 200
+    assert signups.stats()['pending'] == 0
+    assert len(fsyncs) < 100
+    assert not [name for name in os.listdir(directory) if name.endswith(journal.SEGMENT_SUFFIX)]
+
+
+def test_pending_user_is_visible_before_commit(mongo, directory, monkeypatch):
+    signups = journal.SignupJournal(directory, flush_interval=60)
+    monkeypatch.setattr(journal, '_journal', signups)
+    signups.append(make_user(1))
+
+    assert utils.get_user('user1@example.com')['country'] == 'Kenya'
+    assert stored_emails() == []
+    signups.close()
+    assert stored_emails() == ['user1@example.com']
+
+
+def test_orphaned_segment_is_replayed(mongo, directory):
+    os.makedirs(directory)
+    orphan = os.path.join(directory, f"{journal.SEGMENT_PREFIX}1.dead.000000{journal.SEGMENT_SUFFIX}")
+    with open(orphan, 'w') as f:
+        f.write(journal.json.dumps(make_user(1), default=journal._encode) + '\n')
+        f.write('{"email": "torn')
+
+    signups = journal.SignupJournal(directory)
+    assert signups.replay_orphans() == 1
+    signups.close()
+
+    assert stored_emails() == ['user1@example.com']
+    assert not os.path.exists(orphan)
+
+
+def test_segment_held_by_a_live_process_is_skipped(mongo, directory):
+    first = journal.SignupJournal(directory, flush_interval=60)
+    first.append(make_user(1))
+    second = journal.SignupJournal(directory)
+
+    assert second.replay_orphans() == 0
+    assert stored_emails() == []
+    first.close()
+    second.close()
+    assert stored_emails() == ['user1@example.com']
+
+
+def test_failing_commits_stay_pending_and_are_retried(mongo, directory, monkeypatch, caplog):
+    monkeypatch.setattr(journal, 'SIGNUP_ALERT_ATTEMPTS', 2)
+    monkeypatch.setattr(journal, 'SIGNUP_MAX_BACKOFF', 0.05)
+    save_users = utils.save_users
+    attempts = []
+
+    def failing_save_users(users, chunk_size):
+        attempts.append(len(users))
+        return [{"email": user['email'], "status": "failed", "error": "down"} for user in users]
+    monkeypatch.setattr(utils, 'save_users', failing_save_users)
+    signups = journal.SignupJournal(directory, flush_interval=0.01)
+    monkeypatch.setattr(journal, '_journal', signups)
+    signups.append(make_user(1))
+    deadline = time.monotonic() + 5
+    while len(attempts) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # Well past the alert threshold, the signup is still answered
+    assert 'ERROR' in caplog.text
+    assert utils.get_user('user1@example.com')['country'] == 'Kenya'
+    assert stored_emails() == []
+
+    monkeypatch.setattr(utils, 'save_users', save_users)
+    while signups.pending_count() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored_emails() == ['user1@example.com']
+    signups.close()
+
+
+def test_close_leaves_uncommitted_signups_for_replay(mongo, directory, monkeypatch, caplog):
+    save_users = utils.save_users
+    monkeypatch.setattr(utils, 'save_users', lambda users, chunk_size: [
+        {"email": user['email'], "status": "failed", "error": "down"} for user in users
+    ])
+    signups = journal.SignupJournal(directory, flush_interval=60)
+    signups.append(make_user(1))
+    signups.close()
+    assert 'closed with 1 acknowledged signups uncommitted' in caplog.text
+
+    monkeypatch.setattr(utils, 'save_users', save_users)
+    restarted = journal.SignupJournal(directory)
+    assert restarted.replay_orphans() == 1
+    restarted.close()
+    assert stored_emails() == ['user1@example.com']
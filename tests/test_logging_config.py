@@ -0,0 +1,60 @@
+"""Structured logging: module loggers go through the same queue as the app's."""
+import logging
+import queue
+import pytest
+import logging_config
+
+
+@pytest.fixture
+def log_queue(monkeypatch):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    for handler in handlers:
+        root.removeHandler(handler)
+    monkeypatch.setattr(logging_config, '_queue_handler', None)
+    monkeypatch.setattr(logging_config.atexit, 'register', lambda func: None)
+
+    logging_config.setup_logging(logging.getLogger('jobhunter-test-app'))
+    handler = logging_config._queue_handler
+    # Keep the records on the queue instead of starting the file writer
+    handler.on_first_record = None
+    yield handler.queue
+
+    root.removeHandler(handler)
+    for original in handlers:
+        root.addHandler(original)
+    root.setLevel(level)
+
+
+def drain(log_queue):
+    records = []
+    while True:
+        try:
+            records.append(log_queue.get_nowait())
+        except queue.Empty:
+            return records
+
+
+def test_module_loggers_are_queued_with_the_request_id(log_queue, capsys):
+    logging_config.bind_request_id('req-1')
+    try:
+        logging.getLogger('analytics').warning("Analytics update failed: %s", 'down')
+        logging.getLogger('jobhunter-test-app').info("signup")
+    finally:
+        logging_config.bind_request_id(None)
+
+    records = drain(log_queue)
+    assert [(record.name, record.getMessage(), record.request_id) for record in records] == [
+        ('analytics', 'Analytics update failed: down', 'req-1'),
+        ('jobhunter-test-app', 'signup', 'req-1')
+    ]
+    # Nothing reached the last-resort handler on stderr
+    assert capsys.readouterr().err == ''
+
+
+def test_module_logger_storms_are_sampled(log_queue):
+    for _ in range(100):
+        logging.getLogger('scheduler').warning("Job store write failed: %s", 'down')
+
+    burst, every = logging_config.SAMPLING[logging.WARNING]
+    assert len(drain(log_queue)) == burst + (100 - burst) // every
@@ -0,0 +1,58 @@
+"""JobIndex ranking against a brute-force BM25, across updates."""
+import math
+import random
+import pytest
+import matching
+
+WORDS = ['python', 'django', 'react', 'remote', 'senior', 'data', 'engineer', 'developer', 'golang', 'kenya']
+
+
+def make_posting(rng, posting_id):
+    return {
+        'id': posting_id,
+        'title': ' '.join(rng.sample(WORDS, 2)),
+        'description': ' '.join(rng.choices(WORDS, k=rng.randint(3, 30)))
+    }
+
+
+def brute_force(index, keywords, k):
+    total = index._stats_count
+    scores = {}
+    for term in matching.keyword_terms(keywords):
+        docs = index._postings.get(term, {})
+        idf = math.log(1 + (max(total, len(docs)) - len(docs) + 0.5) / (len(docs) + 0.5))
+        for doc, tf in docs.items():
+            scores[doc] = scores.get(doc, 0.0) + idf * index._normalized(tf, index._lengths[doc])
+    return sorted(round(score, 4) for score in scores.values())[::-1][:k]
+
+
+@pytest.fixture
+def index():
+    rng = random.Random(7)
+    index = matching.JobIndex()
+    index.add_postings(make_posting(rng, i) for i in range(500))
+    return index
+
+
+@pytest.mark.parametrize('keywords', ['python', 'senior python developer', 'react, remote', 'golang kenya data'])
+def test_search_matches_brute_force_across_updates(index, keywords):
+    rng = random.Random(keywords)
+    for step in range(20):
+        assert [match['score'] for match in index.search(keywords, k=10)] == brute_force(index, keywords, 10)
+        if step % 3 == 0:
+            index.remove_posting(str(rng.randrange(500)))
+        else:
+            index.add_posting(make_posting(rng, rng.randrange(1000)))
+
+
+def test_cached_results_follow_updates(index):
+    first = [match['id'] for match in index.search('golang')]
+    index.add_posting({'id': 'top', 'title': 'golang golang golang', 'description': 'golang'})
+    assert index.search('golang')[0]['id'] == 'top'
+    assert index.remove_posting('top')
+    assert [match['id'] for match in index.search('golang')] == first
+
+
+def test_unknown_terms(index):
+    assert index.search('cobol') == []
+    assert index.search('') == []
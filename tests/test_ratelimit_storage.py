@@ -0,0 +1,76 @@
+"""SQLite rate-limit storage: exact limits across threads and processes."""
+import multiprocessing
+import sqlite3
+import threading
+import pytest
+import ratelimit_storage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return ratelimit_storage.SQLiteStorage(f"sqlite:///{tmp_path / 'ratelimit.db'}")
+
+
+def test_fixed_window(storage):
+    assert [storage.incr('k', 60) for _ in range(3)] == [1, 2, 3]
+    assert storage.get('k') == 3
+    storage.clear('k')
+    assert storage.get('k') == 0
+
+
+def test_sliding_window_allows_exactly_the_limit_across_threads(storage):
+    allowed = []
+
+    def acquire():
+        allowed.extend(storage.acquire_sliding_window_entry('k', 50, 60) for _ in range(20))
+    threads = [threading.Thread(target=acquire) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert allowed.count(True) == 50
+    assert storage.get_sliding_window('k', 60)[2] == 50
+
+
+def _acquire_in_process(uri, results):
+    storage = ratelimit_storage.SQLiteStorage(uri)
+    results.put(sum(storage.acquire_sliding_window_entry('k', 100, 60) for _ in range(50)))
+
+
+def test_sliding_window_allows_exactly_the_limit_across_processes(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'ratelimit.db'}"
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_acquire_in_process, args=(uri, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+
+    assert sum(results.get(timeout=5) for _ in processes) == 100
+
+
+def test_busy_database_raises_without_leaving_a_transaction(storage, monkeypatch):
+    monkeypatch.setattr(ratelimit_storage, 'BUSY_TIMEOUT_MS', 10)
+    assert storage.acquire_sliding_window_entry('k', 5, 60)
+    blocker = sqlite3.connect(storage.path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    # A fresh thread opens a connection with the short timeout
+    errors = []
+    thread = threading.Thread(target=lambda: _capture(errors, storage.acquire_sliding_window_entry, 'k', 5, 60))
+    thread.start()
+    thread.join()
+    blocker.execute('ROLLBACK')
+
+    assert isinstance(errors[0], sqlite3.OperationalError)
+    assert 'locked' in str(errors[0])
+    assert storage.acquire_sliding_window_entry('k', 5, 60)
+    assert storage.get_sliding_window('k', 60)[2] == 2
+
+
+def _capture(errors, function, *args):
+    try:
+        function(*args)
+    except Exception as e:
+        errors.append(e)
@@ -0,0 +1,52 @@
+"""Request schemas: body limits, Content-Length handling and normalization."""
+import io
+import json
+import pytest
+import schema
+from api import signup
+
+BODY = json.dumps({'email': ' a@example.com ', 'job_keywords': ['Python', 'python ', 'data  science'],
+                   'country': 'Kenya'}).encode()
+
+
+def test_read_normalizes():
+    assert schema.SIGNUP.read(io.BytesIO(BODY), str(len(BODY))) == {
+        'email': 'a@example.com', 'job_keywords': ['Python', 'data science'], 'country': 'Kenya'
+    }
+
+
+@pytest.mark.parametrize('content_length, status', [
+    ('-5', 400),
+    ('abc', 400),
+    (str(schema.MAX_BODY_BYTES + 1), 413),
+    (schema.MAX_BODY_BYTES + 1, 413),
+])
+def test_bad_content_length_is_refused_unread(content_length, status):
+    stream = io.BytesIO(BODY)
+    with pytest.raises(schema.Invalid) as invalid:
+        schema.SIGNUP.read(stream, content_length)
+    assert invalid.value.status == status
+    assert stream.tell() == 0
+
+
+class FakeSocket:
+    def __init__(self, raw):
+        self._raw = raw
+        self.sent = bytearray()
+
+    def makefile(self, mode, bufsize=-1):
+        return io.BytesIO(self._raw)
+
+    def sendall(self, data):
+        self.sent += data
+
+
+@pytest.mark.parametrize('content_length, status', [(b'-5', 400), (b'abc', 400), (b'999999', 413)])
+def test_signup_handler_answers_bad_content_length(content_length, status):
+    sock = FakeSocket(
+        b"POST /api/signup HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+        b"Content-Length: " + content_length + b"\r\n\r\n" + BODY
+    )
+    handler = type('QuietHandler', (signup.handler,), {'log_message': lambda *args: None})
+    handler(sock, ('127.0.0.1', 0), None)
+    assert int(bytes(sock.sent).split(b' ', 2)[1]) == status
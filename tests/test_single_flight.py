@@ -0,0 +1,101 @@
+"""cache.SingleFlight: concurrent identical calls run once."""
+import threading
+import pytest
+from cache import SingleFlight
+
+
+def start_callers(flight, count, key, func, **kwargs):
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do(key, func, **kwargs)))
+        for _ in range(count)
+    ]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_waiters(flight, count):
+    # Every caller but the leader has joined once collapsed reaches count
+    while flight.collapsed < count:
+        threading.Event().wait(0.001)
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(1)
+        release.wait(5)
+        return {'email': 'a@example.com'}
+
+    threads, results = start_callers(flight, 8, 'a', query)
+    wait_for_waiters(flight, 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert flight.leaders == 1 and flight.collapsed == 7
+    assert all(result == {'email': 'a@example.com'} for result, _, _ in results)
+    assert sorted(owner for _, _, owner in results) == [False] * 7 + [True]
+
+
+def test_waiters_share_the_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def query():
+        release.wait(5)
+        raise RuntimeError("down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('a', query)
+        except RuntimeError as e:
+            errors.append(e)
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for_waiters(flight, 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4 and len({id(e) for e in errors}) == 1
+
+
+def test_joins_a_call_under_another_key():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads, results = start_callers(flight, 1, ('a', None), lambda: release.wait(5) and 'full')
+    while not flight.leaders:
+        threading.Event().wait(0.001)
+
+    joiners, joined = start_callers(flight, 1, ('a', 'status'), lambda: pytest.fail("not joined"), also=[('a', None)])
+    wait_for_waiters(flight, 1)
+    release.set()
+    for thread in threads + joiners:
+        thread.join()
+
+    assert results == [('full', ('a', None), True)]
+    assert joined == [('full', ('a', None), False)]
+
+
+def test_forgotten_call_is_not_owned_and_later_calls_start_fresh():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads, results = start_callers(flight, 1, 'a', lambda: release.wait(5) and 'stale')
+    while not flight.leaders:
+        threading.Event().wait(0.001)
+
+    flight.forget('a')
+    assert flight.do('a', lambda: 'fresh') == ('fresh', 'a', True)
+    release.set()
+    threads[0].join()
+
+    assert results == [('stale', 'a', False)]
@@ -0,0 +1,94 @@
+"""Trial sweeper: paging, checkpoint resume and the outbox."""
+from datetime import datetime, timedelta
+import json
+import os
+import pytest
+import sweeper
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return {'outbox': str(tmp_path / 'notices.ndjson'), 'checkpoint_path': str(tmp_path / 'sweep.checkpoint')}
+
+
+def seed(mongo, expired=25, active=5):
+    now = datetime.utcnow().replace(microsecond=0)
+    users = [
+        {'email': f"expired{i}@example.com", 'country': 'Kenya', 'subscription_status': sweeper.TRIAL,
+         # Several users share an expiry, so paging has to break ties on _id
+         'trial_expires': now - timedelta(days=1 + i // 3)}
+        for i in range(expired)
+    ] + [
+        {'email': f"active{i}@example.com", 'country': 'Kenya', 'subscription_status': sweeper.TRIAL,
+         'trial_expires': now + timedelta(days=1)}
+        for i in range(active)
+    ] + [
+        {'email': 'paid@example.com', 'country': 'Kenya', 'subscription_status': 'active',
+         'trial_expires': now - timedelta(days=1)}
+    ]
+    mongo.users.insert_many(users)
+
+
+def statuses(mongo):
+    return {user['email']: user['subscription_status'] for user in mongo.users.find()}
+
+
+def read_notices(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_sweep_expires_ended_trials_only(mongo, paths):
+    seed(mongo)
+    stats = sweeper.sweep(batch_size=4, **paths)
+
+    assert (stats['flipped'], stats['notices'], stats['pages'], stats['resumed']) == (25, 25, 7, False)
+    flipped = {email for email, status in statuses(mongo).items() if status == sweeper.EXPIRED}
+    assert flipped == {f"expired{i}@example.com" for i in range(25)}
+    assert sorted(notice['email'] for notice in read_notices(paths['outbox'])) == sorted(flipped)
+    assert not os.path.exists(paths['checkpoint_path'])
+
+
+def test_crashed_sweep_resumes_from_its_checkpoint(mongo, paths, monkeypatch):
+    seed(mongo)
+    append_notices = sweeper._append_notices
+    pages = []
+
+    def crash_on_third_page(outbox, notices):
+        if len(pages) == 2:
+            raise OSError("disk full")
+        pages.append(notices)
+        append_notices(outbox, notices)
+    monkeypatch.setattr(sweeper, '_append_notices', crash_on_third_page)
+    with pytest.raises(OSError):
+        sweeper.sweep(batch_size=4, **paths)
+
+    checkpoint = sweeper.Checkpoint.load(paths['checkpoint_path'])
+    assert (checkpoint.flipped, checkpoint.notices) == (8, 8)
+
+    monkeypatch.setattr(sweeper, '_append_notices', append_notices)
+    stats = sweeper.sweep(batch_size=4, **paths)
+    assert stats['resumed'] and stats['cutoff'] == checkpoint.cutoff.isoformat()
+    # The third page was flipped before the crash; its notices are
+    # written on resume, ahead of the four pages still to go
+    assert (stats['flipped'], stats['notices'], stats['pages']) == (25, 25, 4)
+    ids = [notice['id'] for notice in read_notices(paths['outbox'])]
+    assert len(ids) == len(set(ids)) == 25
+
+
+def test_trial_renewed_mid_sweep_is_not_expired(mongo, paths, monkeypatch):
+    seed(mongo, expired=1, active=0)
+    find_page = sweeper._find_page
+
+    def renew_after_read(collection, query, limit=0):
+        users = find_page(collection, query, limit)
+        # A new trial starts between the page read and the update
+        mongo.users.update_one({'email': 'expired0@example.com'},
+                               {'$set': {'trial_expires': datetime.utcnow() + timedelta(days=7)}})
+        return users
+    monkeypatch.setattr(sweeper, '_find_page', renew_after_read)
+
+    stats = sweeper.sweep(**paths)
+    assert (stats['flipped'], stats['notices']) == (0, 0)
+    assert statuses(mongo)['expired0@example.com'] == sweeper.TRIAL
+    assert not os.path.exists(paths['outbox']) or read_notices(paths['outbox']) == []
@@ -0,0 +1,38 @@
+"""/api/upgrade: payment options with ETag revalidation."""
+import pytest
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+import utils
+
+
+@pytest.fixture
+def app(mongo, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main.limiter, 'enabled', False)
+    utils.save_user(utils.build_user({'email': 'a@example.com', 'job_keywords': ['python'], 'country': 'Kenya'}))
+    return main.app
+
+
+def get(app, if_none_match=None):
+    """(status, headers, body) exactly as sent, without the test client's defaults."""
+    headers = {'If-None-Match': if_none_match} if if_none_match else {}
+    app_iter, status, response_headers = run_wsgi_app(
+        app, EnvironBuilder('/api/upgrade', query_string={'email': 'a@example.com'}, headers=headers).get_environ()
+    )
+    return int(status.split()[0]), response_headers, b''.join(app_iter)
+
+
+def test_revalidation(app):
+    status, headers, _ = get(app)
+    etag = headers['ETag']
+    assert status == 200 and headers['Content-Type'] == 'application/json'
+
+    # Weak comparison, as CDNs that compress the body send W/ tags back
+    for if_none_match in (etag, f'W/{etag}', f'"other", W/{etag}', '*'):
+        status, headers, body = get(app, if_none_match)
+        assert status == 304, if_none_match
+        assert headers['ETag'] == etag
+        assert headers.get('Content-Type') in (None, 'application/json')
+        assert body == b''
+
+    assert get(app, '"other"')[0] == 200
@@ -0,0 +1,325 @@
+"""Streaming user export and import.
+
+Export reads the users collection with a batched, projected cursor and
+writes NDJSON or CSV as it goes. Import reads users.json (an object
+keyed by email), a JSON array, NDJSON or CSV, normalizes every record to
+the Mongo schema and upserts it in unordered bulk chunks through
+utils.save_users. Neither direction holds more than one batch in memory.
+
+    python transfer.py export users.ndjson [--format csv] [--fields email country]
+    python transfer.py import users.json [--chunk-size 500]
+
+Use - as the path for stdout or stdin.
+"""
+import argparse
+from contextlib import contextmanager
+import csv
+from datetime import datetime, timezone
+import json
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+import database
+import utils
+
+EXPORT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+# How often progress is written to stderr, in seconds
+REPORT_INTERVAL = 5.0
+
+EXPORT_FIELDS = (
+    'email', 'job_keywords', 'country', 'signup_date',
+    'trial_expires', 'trial_active', 'subscription_status'
+)
+
+
+class TransferStats:
+    def __init__(self, unit: str = 'users'):
+        self.unit = unit
+        self.started = time.monotonic()
+        self.read = 0
+        self.invalid = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.written = 0
+        self._last_report = self.started
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"read={self.read} invalid={self.invalid} created={self.created} "
+            f"updated={self.updated} failed={self.failed} written={self.written} "
+            f"rate={self.rate():.0f} {self.unit}/sec"
+        )
+
+    def maybe_report(self) -> None:
+        now = time.monotonic()
+        if now - self._last_report >= REPORT_INTERVAL:
+            self._last_report = now
+            print(self.summary(), file=sys.stderr)
+
+
+@contextmanager
+def _open(path: str, mode: str) -> Iterator[TextIO]:
+    if path == '-':
+        yield sys.stdout if 'w' in mode else sys.stdin
+        return
+    with open(path, mode, encoding='utf-8', newline='') as f:
+        yield f
+
+
+# Export
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return ', '.join(str(item) for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def export_users(out: TextIO, fmt: str = 'ndjson', fields: Iterable[str] = EXPORT_FIELDS,
+                 batch_size: int = EXPORT_BATCH_SIZE, stats: Optional[TransferStats] = None) -> TransferStats:
+    stats = stats or TransferStats()
+    fields = tuple(fields)
+    projection = dict.fromkeys(fields, 1)
+    projection['_id'] = 0
+    cursor = database.get_users_collection().find({}, projection, batch_size=batch_size)
+
+    writer = None
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+    for user in cursor:
+        stats.read += 1
+        if writer:
+            writer.writerow({field: _csv_value(user.get(field)) for field in fields})
+        else:
+            out.write(json.dumps(user, default=_jsonable) + '\n')
+        stats.written += 1
+        stats.maybe_report()
+    out.flush()
+    return stats
+
+
+# Import: read
+
+def _skip_space(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def iter_json_users(f: TextIO, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[Any]:
+    """Yield the values of a top-level JSON object or array one at a time.
+
+    The file is read in chunks and each value is decoded with raw_decode
+    as soon as it is complete, so users.json is never loaded whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = f.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        # Drop what has been consumed so the buffer stays one value long
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def decode() -> Any:
+        # A value that ends exactly at the buffer end may be cut short
+        # (a number, say), so only accept it with input after it or at EOF
+        nonlocal pos
+        while True:
+            start = _skip_space(buffer, pos)
+            try:
+                value, end = decoder.raw_decode(buffer, start)
+                if end < len(buffer) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if not more():
+                value, pos = decoder.raw_decode(buffer, _skip_space(buffer, pos))
+                return value
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            pos = _skip_space(buffer, pos)
+            if pos < len(buffer):
+                return buffer[pos]
+            if not more():
+                raise ValueError("Unexpected end of JSON input")
+
+    opening = peek()
+    if opening not in '{[':
+        raise ValueError("Expected a JSON object or array")
+    closing = '}' if opening == '{' else ']'
+    pos += 1
+    while True:
+        char = peek()
+        if char == closing:
+            return
+        if char == ',':
+            pos += 1
+            continue
+        if opening == '{':
+            decode()  # the key; the record carries its own email
+            if peek() != ':':
+                raise ValueError("Expected ':' after an object key")
+            pos += 1
+        yield decode()
+
+
+def read_users(path: str) -> Iterator[Any]:
+    lower = path.lower()
+    with _open(path, 'r') as f:
+        if lower.endswith('.csv'):
+            yield from csv.DictReader(f)
+        elif lower.endswith(('.ndjson', '.jsonl')):
+            for line in f:
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        yield None
+        else:
+            yield from iter_json_users(f)
+
+
+# Import: normalize and write
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, str) and value.strip():
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if not isinstance(value, datetime):
+        return None
+    # Stored dates are naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def normalize_user(record: Any) -> Optional[Dict[str, Any]]:
+    """Map a stored or exported user to the Mongo schema; None if unusable.
+
+    Keywords become a list, trial_expires a datetime and signup_date an
+    ISO string, as build_user writes them.
+    """
+    if not isinstance(record, dict):
+        return None
+    email = record.get('email')
+    if not isinstance(email, str) or not utils.validate_email(email.strip()):
+        return None
+
+    keywords = record.get('job_keywords')
+    if isinstance(keywords, str):
+        keywords = keywords.split(',')
+    if not isinstance(keywords, list):
+        keywords = []
+    keywords = [item.strip() for item in keywords if isinstance(item, str) and item.strip()]
+
+    try:
+        signup_date = _parse_datetime(record.get('signup_date')) or datetime.utcnow()
+        trial_expires = _parse_datetime(record.get('trial_expires'))
+    except ValueError:
+        return None
+    if trial_expires is None:
+        trial_expires = utils.get_trial_expiry({'signup_date': signup_date.isoformat()})
+    # BSON dates hold milliseconds
+    trial_expires = trial_expires.replace(microsecond=trial_expires.microsecond // 1000 * 1000)
+
+    country = record.get('country')
+    return {
+        "email": email.strip(),
+        "job_keywords": keywords,
+        "country": country.strip() if isinstance(country, str) else '',
+        "signup_date": signup_date.isoformat(),
+        "trial_expires": trial_expires,
+        "trial_active": datetime.utcnow() < trial_expires,
+        "subscription_status": record.get('subscription_status') or 'trial'
+    }
+
+
+def _chunks(users: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for user in users:
+        chunk.append(user)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_users(records: Iterable[Any], chunk_size: int = utils.BULK_CHUNK_SIZE,
+                 stats: Optional[TransferStats] = None) -> TransferStats:
+    stats = stats or TransferStats()
+
+    def normalized() -> Iterator[Dict[str, Any]]:
+        for record in records:
+            stats.read += 1
+            user = normalize_user(record)
+            if user is None:
+                stats.invalid += 1
+                continue
+            yield user
+
+    for chunk in _chunks(normalized(), chunk_size):
+        for result in utils.save_users(chunk, chunk_size=chunk_size):
+            status = result['status']
+            if status == 'created':
+                stats.created += 1
+            elif status == 'updated':
+                stats.updated += 1
+            else:
+                stats.failed += 1
+        stats.written += len(chunk)
+        stats.maybe_report()
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export or import JobHunter users")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = commands.add_parser('export', help="Write the users collection to a file")
+    export_parser.add_argument('path', help="Output file, or - for stdout")
+    export_parser.add_argument('--format', choices=['ndjson', 'csv'], help="Default: from the file extension")
+    export_parser.add_argument('--fields', nargs='+', default=list(EXPORT_FIELDS))
+    export_parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+
+    import_parser = commands.add_parser('import', help="Upsert users from users.json, NDJSON or CSV")
+    import_parser.add_argument('path', help="Input file, or - for stdin (read as users.json)")
+    import_parser.add_argument('--chunk-size', type=int, default=utils.BULK_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        fmt = args.format or ('csv' if args.path.lower().endswith('.csv') else 'ndjson')
+        with _open(args.path, 'w') as out:
+            result = export_users(out, fmt=fmt, fields=args.fields, batch_size=args.batch_size)
+    else:
+        database.ensure_indexes()
+        result = import_users(read_users(args.path), chunk_size=args.chunk_size)
+    print(result.summary(), file=sys.stderr)
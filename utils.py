@@ -1,98 +1,308 @@
-from pymongo import MongoClient
 from datetime import datetime, timedelta
 import os
-from dotenv import load_dotenv
 import re
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+import analytics
+import database
+import journal
+import payments
+from cache import TTLCache, SingleFlight, MISSING
 
-# Load environment variables
-load_dotenv()
+# User cache. Entries live for USER_CACHE_TTL seconds; a non-zero
+# USER_CACHE_NEGATIVE_TTL also remembers unknown emails for that long.
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '4096'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv('USER_CACHE_NEGATIVE_TTL', '0'))
 
-# MongoDB setup
-MONGODB_URI = os.getenv('MONGODB_URI')
-if not MONGODB_URI:
-    raise ValueError("No MONGODB_URI found in environment variables")
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
-client = MongoClient(MONGODB_URI)
-db = client.jobhunter
-users_collection = db.users
+# Concurrent cache misses for the same user share one query
+user_lookups = SingleFlight()
+
+TRIAL_DAYS = 3
+
+# subscription_status values of paying users
+PAID_STATUSES = ('active', 'paid')
+
+# Upserts per bulk_write call when saving users in batches
+BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '500'))
+
+# Per-call-site projections: each route fetches only the fields it reads
+STATUS_FIELDS = ('trial_expires', 'signup_date')
+RUN_FIELDS = ('trial_expires', 'signup_date', 'job_keywords')
+UPGRADE_FIELDS = ('country',)
+
+# Every projection a cache entry has been stored under, for invalidation
+_cached_projections = {None, STATUS_FIELDS, RUN_FIELDS, UPGRADE_FIELDS}
+
+# Validation tables, built once at import so a preloaded server shares
+# them with every worker
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+VALID_COUNTRIES = frozenset(('Uganda', 'Kenya', 'Nigeria', 'Ghana', 'Tanzania', 'Rwanda'))
 
 def validate_email(email: str) -> bool:
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(EMAIL_PATTERN.match(email))
 
 def validate_job_keywords(keywords: List[str]) -> bool:
     return all(isinstance(k, str) and len(k.strip()) > 0 for k in keywords)
 
 def validate_country(country: str) -> bool:
-    valid_countries = ['Uganda', 'Kenya', 'Nigeria', 'Ghana', 'Tanzania', 'Rwanda']
-    return country in valid_countries or country.strip() != ''
+    return country in VALID_COUNTRIES or country.strip() != ''
 
 def test_db_connection() -> bool:
     try:
-        client.admin.command('ismaster')
+        database.get_client().admin.command('ismaster')
         return True
     except Exception as e:
         raise Exception(f"Database connection failed: {str(e)}")
 
+def build_user(data: Dict[str, Any]) -> Dict[str, Any]:
+    # BSON dates hold milliseconds; truncate so the stored expiry and the
+    # one reported at signup agree
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    return {
+        "email": data['email'],
+        "job_keywords": data['job_keywords'],
+        "country": data['country'],
+        "signup_date": now.isoformat(),
+        "trial_expires": now + timedelta(days=TRIAL_DAYS),
+        "trial_active": True,
+        "subscription_status": "trial"
+    }
+
+def _analytics_projection(*extra: str) -> Dict[str, int]:
+    projection = dict.fromkeys(analytics.FIELDS + extra, 1)
+    projection['_id'] = 0
+    return projection
+
 def save_user(user: Dict[str, Any]) -> bool:
+    from pymongo import ReturnDocument
+
     try:
-        result = users_collection.update_one(
+        # The previous document gives the analytics deltas without a
+        # second round trip
+        before = database.get_users_collection().find_one_and_update(
             {'email': user['email']},
             {'$set': user},
-            upsert=True
+            projection=_analytics_projection(),
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
         )
-        return bool(result.acknowledged)
     except Exception as e:
         raise Exception(f"Failed to save user: {str(e)}")
+    finally:
+        # The stored document is the merge of $set with whatever was there,
+        # so drop the entry rather than guess at it
+        invalidate_user(user['email'])
+
+    analytics.record([(before, dict(before or {}, **user))])
+    return True
+
+def save_signup(user: Dict[str, Any]) -> bool:
+    """Save a new user, through the write-behind journal when enabled.
+
+    With SIGNUP_WRITE_BEHIND=1 this returns once the user is durable in
+    the local journal; it reaches Mongo moments later.
+    """
+    if not journal.SIGNUP_WRITE_BEHIND:
+        return save_user(user)
+    try:
+        journal.get_journal().append(user)
+    except Exception as e:
+        raise Exception(f"Failed to save user: {str(e)}")
+    invalidate_user(user['email'])
+    return True
+
+def save_users(users: List[Dict[str, Any]], chunk_size: int = BULK_CHUNK_SIZE) -> List[Dict[str, Any]]:
+    """Upsert users with unordered bulk writes, chunk_size at a time.
+
+    Returns one result per user, in input order, with a status of
+    "created", "updated" or "failed". A failed write does not stop the
+    rest of its chunk.
+    """
+    from pymongo import UpdateOne
+    from pymongo.errors import BulkWriteError
+
+    collection = database.get_users_collection()
+    results = []
+
+    for start in range(0, len(users), chunk_size):
+        chunk = users[start:start + chunk_size]
+        # bulk_write cannot return the replaced documents, so read them
+        # first for the analytics deltas
+        try:
+            cursor = collection.find({'email': {'$in': [user['email'] for user in chunk]}}, _analytics_projection('email'))
+            stored = {doc['email']: doc for doc in cursor}
+        except Exception as e:
+            results.extend({"email": user['email'], "status": "failed", "error": str(e)} for user in chunk)
+            continue
+        requests = [
+            UpdateOne({'email': user['email']}, {'$set': user}, upsert=True)
+            for user in chunk
+        ]
+        upserted = {}
+        failed = {}
+        try:
+            upserted = collection.bulk_write(requests, ordered=False).upserted_ids
+        except BulkWriteError as e:
+            upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+            failed = {error['index']: error.get('errmsg', 'Write failed') for error in e.details.get('writeErrors', [])}
+        except Exception as e:
+            failed = {index: str(e) for index in range(len(chunk))}
+        finally:
+            for user in chunk:
+                invalidate_user(user['email'])
+
+        changes = []
+        for index, user in enumerate(chunk):
+            if index in failed:
+                results.append({"email": user['email'], "status": "failed", "error": failed[index]})
+                continue
+            results.append({"email": user['email'], "status": "created" if index in upserted else "updated"})
+            before = None if index in upserted else stored.get(user['email'])
+            after = dict(before or {}, **user)
+            stored[user['email']] = after
+            changes.append((before, after))
+        analytics.record(changes)
+
+    return results
+
+def ensure_indexes() -> None:
+    database.ensure_indexes()
+
+def _projection(fields: Optional[Tuple[str, ...]]) -> Optional[Dict[str, int]]:
+    if fields is None:
+        return None
+    # email is always included so a matched document is never empty
+    projection = {field: 1 for field in fields}
+    projection['email'] = 1
+    projection['_id'] = 0
+    return projection
+
+def _narrow(user: Dict[str, Any], fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    if fields is None:
+        return dict(user)
+    return {field: user[field] for field in ('email',) + fields if field in user}
+
+def cache_user(user: Dict[str, Any]) -> None:
+    """Cache a user known to be stored exactly as given, under each route projection."""
+    for fields in (STATUS_FIELDS, RUN_FIELDS, UPGRADE_FIELDS):
+        user_cache.set((user['email'], fields), _narrow(user, fields))
+
+def get_user(email: str, fields: Optional[Tuple[str, ...]] = None) -> Optional[Dict[str, Any]]:
+    # A journaled signup not yet written to Mongo is the newest version
+    journaled = journal.pending_user(email)
+    if journaled is not None:
+        return _narrow(journaled, fields)
+
+    key = (email, fields)
+    cached = user_cache.get(key)
+    if cached is not MISSING:
+        return dict(cached) if cached is not None else None
+
+    def query():
+        try:
+            return database.get_users_collection().find_one(
+                {'email': email},
+                _projection(fields)
+            )
+        except Exception as e:
+            raise Exception(f"Failed to get user: {str(e)}")
+
+    # Registered before querying so a concurrent write can forget the flight
+    _cached_projections.add(fields)
+    # A lookup of the whole document in flight answers any projection
+    also = ((email, None),) if fields is not None else ()
+    user, joined, owner = user_lookups.do(key, query, also)
+
+    if user is not None:
+        user = _narrow(user, fields) if joined != key else user
+        if owner:
+            user_cache.set(key, user)
+        return dict(user)
+    if owner and USER_CACHE_NEGATIVE_TTL > 0:
+        user_cache.set(key, None, ttl=USER_CACHE_NEGATIVE_TTL)
+    return None
+
+def get_users(emails: List[str], fields: Optional[Tuple[str, ...]] = None) -> Dict[str, Dict[str, Any]]:
+    """Look up many users at once, keyed by email; unknown emails are absent.
+
+    Cached users are served from the cache and the rest are fetched with a
+    single $in query.
+    """
+    users = {}
+    pending = []
+    for email in emails:
+        journaled = journal.pending_user(email)
+        if journaled is not None:
+            users[email] = _narrow(journaled, fields)
+            continue
+        cached = user_cache.get((email, fields))
+        if cached is MISSING:
+            pending.append(email)
+        elif cached is not None:
+            users[email] = dict(cached)
+
+    if not pending:
+        return users
 
-def get_user(email: str) -> Optional[Dict[str, Any]]:
     try:
-        return users_collection.find_one({'email': email})
+        cursor = database.get_users_collection().find(
+            {'email': {'$in': pending}},
+            _projection(fields) or {'_id': 0}
+        )
+        found = {user['email']: user for user in cursor}
     except Exception as e:
-        raise Exception(f"Failed to get user: {str(e)}")
+        raise Exception(f"Failed to get users: {str(e)}")
+
+    _cached_projections.add(fields)
+    for email in pending:
+        user = found.get(email)
+        if user is not None:
+            user_cache.set((email, fields), user)
+            users[email] = dict(user)
+        elif USER_CACHE_NEGATIVE_TTL > 0:
+            user_cache.set((email, fields), None, ttl=USER_CACHE_NEGATIVE_TTL)
+    return users
+
+def invalidate_user(email: str) -> None:
+    for fields in list(_cached_projections):
+        user_cache.delete((email, fields))
+        # A lookup that started before the write must not be cached or joined
+        user_lookups.forget((email, fields))
+
+def get_user_cache_stats() -> Dict[str, int]:
+    return user_cache.stats()
+
+def get_user_lookup_stats() -> Dict[str, int]:
+    return user_lookups.stats()
+
+def get_trial_expiry(user: Dict[str, Any]) -> datetime:
+    """Return the trial expiry as a naive UTC datetime.
+
+    Documents written since trial_expires became a BSON date are a plain
+    field read; older ones fall back to parsing signup_date until the
+    backfill in migrations.py has run.
+    """
+    trial_expires = user.get('trial_expires')
+    if isinstance(trial_expires, datetime):
+        return trial_expires
+    if isinstance(trial_expires, str):
+        return datetime.fromisoformat(trial_expires)
+    return datetime.fromisoformat(user['signup_date']) + timedelta(days=TRIAL_DAYS)
 
 def is_trial_active(user: Dict[str, Any]) -> bool:
     try:
-        signup_date = datetime.fromisoformat(user['signup_date'])
-        trial_end = signup_date + timedelta(days=3)
-        return datetime.utcnow() < trial_end
+        return datetime.utcnow() < get_trial_expiry(user)
     except Exception as e:
         raise Exception(f"Failed to check trial status: {str(e)}")
 
 def get_trial_end(user: Dict[str, Any]) -> str:
     try:
-        signup_date = datetime.fromisoformat(user['signup_date'])
-        return (signup_date + timedelta(days=3)).isoformat()
+        return get_trial_expiry(user).isoformat()
     except Exception as e:
         raise Exception(f"Failed to get trial end date: {str(e)}")
 
 def get_payment_options(country: str) -> Dict[str, Any]:
-    mobile_money_countries = ['Uganda', 'Kenya', 'Nigeria', 'Ghana', 'Tanzania', 'Rwanda']
-    
-    if country in mobile_money_countries:
-        return {
-            "method": "Mobile Money",
-            "options": [
-                {
-                    "provider": "MTN Mobile Money",
-                    "link": "https://payment.jobhunterpro.com/mtn-momo",
-                    "description": "Pay with MTN Mobile Money"
-                },
-                {
-                    "provider": "Airtel Money",
-                    "link": "https://payment.jobhunterpro.com/airtel-money",
-                    "description": "Pay with Airtel Money"
-                }
-            ]
-        }
-    return {
-        "method": "Credit Card",
-        "options": [
-            {
-                "provider": "Stripe",
-                "link": "https://payment.jobhunterpro.com/stripe",
-                "description": "Secure card payment via Stripe"
-            }
-        ]
-    }
\ No newline at end of file
+    return payments.get_payment_options(country)